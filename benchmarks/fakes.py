@@ -0,0 +1,188 @@
+"""
+In-process fakes of the Google Sheets v4 API and the Telegram Bot API.
+
+Both run on one local uvicorn server in a background thread, so the bot talks
+to them over real HTTP through its usual clients. Point the bot at them with
+SHEETS_API_ENDPOINT=<url> and TELEGRAM_API_URL=<url>/bot.
+"""
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import urllib.parse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "CashBotic", "username": "cashbotic_bench_bot"}
+
+
+def _tab(range_: str) -> str:
+    """Tab name of an A1 range such as "'March'!A:F" or "March!A1:F1"."""
+    return range_.rsplit("!", 1)[0].strip("'")
+
+
+class FakeSheets:
+    """
+    Spreadsheet state and request counters behind the fake Sheets routes.
+
+    Every request waits `latency` seconds; a `throttle_rate` fraction of them
+    is answered with 429 instead, before touching any state.
+    """
+
+    def __init__(self, latency: float = 0.0, throttle_rate: float = 0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.tabs = {"Sheet1": 0}
+        self.values = {}
+        self.requests = {}
+        self.throttled = 0
+
+    def _count(self, method: str) -> None:
+        self.requests[method] = self.requests.get(method, 0) + 1
+
+    async def _admit(self, method: str):
+        """Simulate latency; return a 429 response for throttled requests."""
+        self._count(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.throttle_rate:
+            self.throttled += 1
+            return JSONResponse({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                           "message": "Quota exceeded"}}, status_code=429)
+        return None
+
+    def rows(self) -> int:
+        """Expense rows appended so far, headers excluded."""
+        return sum(len(rows) - 1 if rows and rows[0][:1] == ["Date"] else len(rows)
+                   for rows in self.values.values())
+
+    def routes(self, app: FastAPI) -> None:
+        @app.get("/v4/spreadsheets/{spreadsheet_id}")
+        async def get(spreadsheet_id: str):
+            return await self._admit("get") or {
+                "spreadsheetId": spreadsheet_id,
+                "sheets": [{"properties": {"title": t, "sheetId": i}} for t, i in self.tabs.items()],
+            }
+
+        @app.post("/v4/spreadsheets/{spreadsheet_id}:batchUpdate")
+        async def batch_update(spreadsheet_id: str, request: Request):
+            body = await request.json()
+            throttled = await self._admit("batchUpdate")
+            if throttled:
+                return throttled
+            replies = []
+            for r in body.get("requests", []):
+                if "addSheet" in r:
+                    title = r["addSheet"]["properties"]["title"]
+                    self.tabs.setdefault(title, len(self.tabs))
+                    replies.append({"addSheet": {"properties": {"title": title,
+                                                                "sheetId": self.tabs[title]}}})
+                else:
+                    replies.append({})
+            return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+        @app.post("/v4/spreadsheets/{spreadsheet_id}/values/{range_}:append")
+        async def append(spreadsheet_id: str, range_: str, request: Request):
+            body = await request.json()
+            throttled = await self._admit("values.append")
+            if throttled:
+                return throttled
+            rows = body.get("values", [])
+            self.values.setdefault(_tab(range_), []).extend(rows)
+            return {"spreadsheetId": spreadsheet_id, "updates": {"updatedRows": len(rows)}}
+
+        @app.put("/v4/spreadsheets/{spreadsheet_id}/values/{range_}")
+        async def update(spreadsheet_id: str, range_: str, request: Request):
+            body = await request.json()
+            throttled = await self._admit("values.update")
+            if throttled:
+                return throttled
+            # Only used for the header row of a new tab.
+            rows = self.values.setdefault(_tab(range_), [])
+            rows[:len(body.get("values", []))] = body.get("values", [])
+            return {"spreadsheetId": spreadsheet_id, "updatedRows": len(body.get("values", []))}
+
+        @app.get("/v4/spreadsheets/{spreadsheet_id}/values:batchGet")
+        async def batch_get(spreadsheet_id: str, request: Request):
+            throttled = await self._admit("values.batchGet")
+            if throttled:
+                return throttled
+            ranges = request.query_params.getlist("ranges")
+            return {"spreadsheetId": spreadsheet_id,
+                    "valueRanges": [{"range": r, "values": self.values.get(_tab(r), [])}
+                                    for r in ranges]}
+
+        @app.get("/v4/spreadsheets/{spreadsheet_id}/values/{range_}")
+        async def values_get(spreadsheet_id: str, range_: str):
+            return await self._admit("values.get") or {
+                "range": range_, "values": self.values.get(_tab(range_), [])}
+
+
+class FakeTelegram:
+    """
+    Bot API methods the bot calls, answering with minimal valid objects.
+
+    `on_send(chat_id, text, received_at)` is called (on the fake's thread)
+    for every sendMessage, so a load driver can tell when a reply arrived.
+    """
+
+    def __init__(self, latency: float = 0.0, on_send=None):
+        self.latency = latency
+        self.on_send = on_send
+        self.requests = {}
+        self._message_ids = iter(range(1, 1 << 62))
+
+    def _message(self, chat_id, text: str) -> dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"}, "from": BOT_USER, "text": text}
+
+    def routes(self, app: FastAPI) -> None:
+        @app.post("/bot{token}/{method}")
+        async def bot_api(token: str, method: str, request: Request):
+            received_at = time.perf_counter()
+            self.requests[method] = self.requests.get(method, 0) + 1
+            # PTB posts form fields whose values are JSON encoded.
+            params = {k: v[-1] for k, v in urllib.parse.parse_qs((await request.body()).decode()).items()}
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if method == "getMe":
+                result = BOT_USER
+            elif method in ("sendMessage", "editMessageText"):
+                chat_id = json.loads(params.get("chat_id", "0"))
+                text = params.get("text", "")
+                result = self._message(chat_id, text)
+                if method == "sendMessage" and self.on_send:
+                    self.on_send(int(chat_id), text, received_at)
+            else:
+                result = True
+            return {"ok": True, "result": result}
+
+
+class FakeServer:
+    """Serves FakeSheets and FakeTelegram on 127.0.0.1 from a background thread."""
+
+    def __init__(self, sheets: FakeSheets, telegram: FakeTelegram):
+        self.sheets = sheets
+        self.telegram = telegram
+        app = FastAPI()
+        sheets.routes(app)
+        telegram.routes(app)
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run,
+                                        kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join()
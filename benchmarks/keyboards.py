@@ -0,0 +1,48 @@
+"""
+Per-render cost of the inline keyboards, uncached vs cached.
+
+Run from the repository root:
+
+    python benchmarks/keyboards.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import telegramcalendar
+from keyboards import category_keyboard
+from utils import CATEGORIES, chunk_list
+
+NUMBER = 2000
+
+
+def build_category_keyboard():
+    """What every category prompt used to do."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(cat, callback_data=cat) for cat in row]
+                                 for row in chunk_list(CATEGORIES, 3)])
+
+
+def report(name, fn):
+    seconds = timeit.timeit(fn, number=NUMBER) / NUMBER
+    print(f"{name:<32} {seconds * 1e6:10.2f} µs/render")
+    return seconds
+
+
+def main():
+    before = report("category keyboard (built)", build_category_keyboard)
+    after = report("category keyboard (cached)", category_keyboard)
+    print(f"{'':<32} {before / after:10.0f}x faster")
+
+    build = telegramcalendar._build_calendar.__wrapped__
+    before = report("calendar month (built)", lambda: build(2025, 4))
+    telegramcalendar.create_calendar(2025, 4)
+    after = report("calendar month (cached)", lambda: telegramcalendar.create_calendar(2025, 4))
+    print(f"{'':<32} {before / after:10.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+End-to-end webhook throughput against fake Sheets and Telegram backends.
+
+Runs the FastAPI `app` in-process, posts synthetic /oneoff → expense text →
+category callback conversations from many concurrent chats to /webhook and
+times each update from the POST until the bot's reply reaches the fake Bot
+API. Nothing leaves the machine.
+
+Run from the repository root:
+
+    python benchmarks/webhook_load.py --chats 200 --rounds 5 \\
+        --sheets-latency 0.2 --sheets-429-rate 0.05
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import logging
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeServer, FakeSheets, FakeTelegram
+from utils import CATEGORIES
+
+PRODUCTS = ["coffee", "lunch", "groceries", "taxi", "movie", "book", "dinner",
+            "shampoo", "train", "snacks", "gift", "parking"]
+EXPENSE_CATEGORIES = [c for c in CATEGORIES if c != "Income"]
+TOKEN = "123456:benchmark"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=100, help="concurrent chats")
+    parser.add_argument("--rounds", type=int, default=5, help="expenses logged per chat")
+    parser.add_argument("--sheets-latency", type=float, default=0.1,
+                        help="seconds added to every Sheets request")
+    parser.add_argument("--sheets-429-rate", type=float, default=0.0,
+                        help="fraction of Sheets requests answered with 429")
+    parser.add_argument("--telegram-latency", type=float, default=0.02,
+                        help="seconds added to every Bot API request")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="seconds to wait for a reply before counting a failure")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's logging")
+    return parser.parse_args()
+
+
+def configure(url: str, workdir: str) -> None:
+    """Point the bot at the fakes; must run before `bot` is imported."""
+    from google.auth.credentials import AnonymousCredentials
+
+    os.environ.update(
+        TOKEN=TOKEN,
+        SPREADSHEET_ID="benchmark",
+        GOOGLE_TOKEN_PICKLE_B64=base64.b64encode(pickle.dumps(AnonymousCredentials())).decode(),
+        SHEETS_API_ENDPOINT=url,
+        TELEGRAM_API_URL=f"{url}/bot",
+        LEDGER_PATH=os.path.join(workdir, "ledger.db"),
+        TOKEN_CACHE_DIR=os.path.join(workdir, "tokens"),
+        TENANTS_FILE=os.path.join(workdir, "tenants.json"),
+    )
+    # Quick retries, so injected 429s cost what the backoff policy costs
+    # rather than seconds of idle time; override from the environment.
+    os.environ.setdefault("SHEETS_BACKOFF_BASE", "0.05")
+    os.environ.setdefault("SHEETS_BACKOFF_MAX", "1")
+
+
+class Replies:
+    """Futures resolved when the fake Bot API receives a sendMessage for a chat."""
+
+    def __init__(self):
+        self.loop = None
+        self._waiting = {}
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        future = self.loop.create_future()
+        self._waiting[chat_id] = future
+        return future
+
+    def on_send(self, chat_id: int, text: str, received_at: float) -> None:
+        # Called on the fake server's thread.
+        future = self._waiting.pop(chat_id, None)
+        if future is not None:
+            self.loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result((text, received_at)))
+
+
+def message_update(update_id: int, chat_id: int, message_id: int, text: str) -> dict:
+    message = {"message_id": message_id, "date": int(time.time()), "text": text,
+               "chat": {"id": chat_id, "type": "private"},
+               "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"}}
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0,
+                                "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, chat_id: int, message_id: int, data: str) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": str(chat_id), "data": data,
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "message": {"message_id": message_id, "date": int(time.time()), "text": "Category?",
+                    "chat": {"id": chat_id, "type": "private"}}}}
+
+
+async def run_chat(client, replies: Replies, chat_id: int, args, update_ids,
+                   latencies: list, failures: list) -> None:
+    async def send(update: dict) -> str | None:
+        reply = replies.expect(chat_id)
+        started = time.perf_counter()
+        response = await client.post("/webhook", json=update)
+        if response.status_code != 200:
+            failures.append(f"HTTP {response.status_code}")
+            return None
+        try:
+            text, received_at = await asyncio.wait_for(reply, args.timeout)
+        except asyncio.TimeoutError:
+            failures.append("timeout")
+            return None
+        latencies.append(received_at - started)
+        return text
+
+    message_ids = itertools.count(1)
+    for _ in range(args.rounds):
+        if await send(message_update(next(update_ids), chat_id, next(message_ids), "/oneoff")) is None:
+            continue
+        text = f"{random.choice(PRODUCTS)} {random.randint(1, 5000) / 100}"
+        reply = await send(message_update(next(update_ids), chat_id, next(message_ids), text))
+        if reply is None or reply.startswith("Successfully"):
+            # Failed, or the category was learned and applied without asking.
+            continue
+        await send(callback_update(next(update_ids), chat_id, next(message_ids),
+                                   random.choice(EXPENSE_CATEGORIES)))
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))]
+
+
+async def main(args, server: FakeServer) -> None:
+    """
+    Run the load against `server`; `configure(server.url, ...)` must have
+    been called first.
+    """
+    import httpx
+
+    import bot
+
+    replies = Replies()
+    replies.loop = asyncio.get_running_loop()
+    server.telegram.on_send = replies.on_send
+    latencies, failures = [], []
+    update_ids = itertools.count(1)
+
+    transport = httpx.ASGITransport(app=bot.app)
+    async with bot.app.router.lifespan_context(bot.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(run_chat(client, replies, 10_000 + i, args, update_ids,
+                                            latencies, failures)
+                                   for i in range(args.chats)))
+            elapsed = time.perf_counter() - started
+        # Shutting down drains the ledger to the fake sheet.
+        saved = bot.ledger.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    latencies.sort()
+    print(f"chats {args.chats}, rounds {args.rounds}, "
+          f"sheets latency {args.sheets_latency}s, 429 rate {args.sheets_429_rate:.0%}")
+    print(f"updates      {len(latencies)} in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} updates/s), {len(failures)} failed")
+    print("latency      p50 {:.1f}ms  p95 {:.1f}ms  p99 {:.1f}ms  max {:.1f}ms".format(
+        *(percentile(latencies, p) * 1000 for p in (50, 95, 99, 100))))
+    print(f"expenses     {saved} saved, {server.sheets.rows()} rows in the sheet")
+    print(f"sheets       {dict(sorted(server.sheets.requests.items()))}, "
+          f"{server.sheets.throttled} throttled")
+    print(f"bot api      {dict(sorted(server.telegram.requests.items()))}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="cashbotic-bench-")
+    server = FakeServer(FakeSheets(args.sheets_latency, args.sheets_429_rate),
+                        FakeTelegram(args.telegram_latency))
+    server.start()
+    configure(server.url, workdir)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    try:
+        asyncio.run(main(args, server))
+    finally:
+        server.stop()
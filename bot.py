@@ -1,27 +1,60 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import asyncio
+import hashlib
 import logging
 import os
+import re
+import tempfile
+import uuid
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 import telegramcalendar
 
-from spreadsheet import write, get_insights
+from spreadsheet import drain, sync_rows, write_stats, insights_cache_stats, warm_up
+from sheets_client import scheduler as sheets_scheduler
 from expenditure import Expenditure
-from utils import find_date, chunk_list, CATEGORIES, format_calendar_date, import_token, format_insights_message
-
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from ledger import Ledger
+from insights import format_amount
+from reports import parse_period, period_insights
+from budgets import Budgets
+from recurring import RecurringExpenses, RecurringScheduler, describe_schedule
+from syncer import LedgerSyncer
+from tenants import tenant_for, pool as sheets_pool
+from credentials import CredentialRefresher, stats as credential_stats
+from dispatcher import UpdateDispatcher
+from dedup import UpdateDeduplicator
+import metrics
+from persistence import build_persistence
+from importer import import_expenses
+from expense_parser import parse_expenses
+from classifier import CategoryClassifier
+from keyboards import CATEGORY_PATTERN, category_keyboard
+from utils import (find_date, format_calendar_date, import_token, format_insights_message,
+                   escape_markdown_v2, parse_amount)
+from log_config import configure_logging
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Recorded recurring expenses listed in a notification before summarising.
+RECURRING_NOTIFY_LINES = 10
+
+# Namespace for deterministic expense row IDs
+EXPENSE_ID_NAMESPACE = uuid.UUID("6f0b6b1e-4c1a-4d8e-9a57-1c2f3b4d5e6f")
+
 # State constants
 WAITING_FOR_EXPENSE_INPUT = 0
 WAITING_FOR_CATEGORY_CHOICE = 1
 SELECTING_DATE = 2
+WAITING_FOR_IMPORT = 3
 
 ### COMMAND HANDLERS ####
 
@@ -34,7 +67,7 @@ async def start_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def prompt_product_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info("Entered prompt_product_price()")
+    logger.debug("Entered prompt_product_price()")
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=f"Please send the expense in the format: Product-Price"
@@ -42,15 +75,20 @@ async def prompt_product_price(update: Update, context: ContextTypes.DEFAULT_TYP
     return WAITING_FOR_EXPENSE_INPUT
 
 
+async def oneoff_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Expenses logged with /oneoff are for today, whatever /past was left with.
+    context.user_data.pop("selected_date", None)
+    return await prompt_product_price(update, context)
+
+
 async def store_date_and_prompt_price(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
-    await query.answer()
-
-    selected_date = query.data
-    formatted_date = format_calendar_date(selected_date)
-    context.user_data['selected_date'] = formatted_date
+    selected, date = await telegramcalendar.process_calendar_selection(update, context)
+    if not selected:
+        return SELECTING_DATE
 
-    await query.edit_message_text(f"Date selected: {formatted_date}")
+    context.user_data['selected_date'] = date.isoformat()
+    await query.edit_message_text(f"Date selected: {format_calendar_date(date)}")
 
     return await prompt_product_price(update, context)
 
@@ -62,111 +100,329 @@ async def past_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-def parse_product_price(user_input: str) -> Expenditure:
-    """
-    Parses user input in 'Product-Price' format and creates an Expenditure object.
-
-    Args:
-        user_input (str): User input string.
-
-    Returns:
-        Expenditure: A validated expenditure object.
-
-    Raises:
-        ValueError: If the input format is invalid or price is not a number.
-    """
-    product, price = user_input.split('-')
-    price = float(price)
-    date = find_date()
-    return Expenditure(product, price, date)
-
-
 async def validate_and_prompt_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Save expenditure and product
-    Prompt categories keyboard
+    Parse one or more expenses from the message and save them, prompting the
+    categories keyboard for those without an inline category.
 
     Args:
         update (Update)
         context (ContextTypes)
 
     Returns:
-        int: state ('WAITING_FOR_CATEGORY_CHOICE') that represents that categories have been chosen
+        int: 'WAITING_FOR_CATEGORY_CHOICE' while expenses still need a category
     """
-    logging.info("Entered WAITING_FOR_EXPENSE_INPUT state")
-    user_input = update.message.text
-    try:
-        expenditure = parse_product_price(user_input)
-        context.user_data["expenditure"] = expenditure
-
-        keyboard = [[InlineKeyboardButton(cat, callback_data=cat) for cat in row]
-                    for row in chunk_list(CATEGORIES, 3)]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Choose a category:", reply_markup=reply_markup)
-        return WAITING_FOR_CATEGORY_CHOICE
-
-    except ValueError as e:
-        logging.exception("ValueError occurred while processing user input.")
+    logger.debug("Entered WAITING_FOR_EXPENSE_INPUT state")
+    expenses, errors = parse_expenses(update.message.text,
+                                      date=context.user_data.get("selected_date"))
+    if errors or not expenses:
         await update.message.reply_text(
-            "Incorrect format. Please use 'Product-Price' format (e.g., 'Coffee-3.50')."
+            "Incorrect format. Please send one expense per line as 'Product-Price' "
+            "or 'Product Price [Category]' (e.g. 'Coffee-3.50' or 'Coffee 3.50 Food').\n"
+            + "\n".join(errors)
         )
         return WAITING_FOR_EXPENSE_INPUT
 
+    user_id = update.effective_user.id
+    for i, expenditure in enumerate(expenses):
+        expenditure.user_id = user_id
+        if not expenditure.category:
+            category, confident = classifier.suggest(user_id, expenditure.product)
+            if confident:
+                expenditure.category = category
+                expenditure.set_spend_type()
+        # Derive row IDs from the message so a redelivered update maps to the
+        # same ledger rows instead of booking the expenses twice.
+        expenditure.id = uuid.uuid5(
+            EXPENSE_ID_NAMESPACE,
+            f"{update.effective_chat.id}:{update.message.message_id}:{i}").hex
+    context.user_data["expenses"] = expenses
+
+    pending = next((e for e in expenses if not e.category), None)
+    if pending is None:
+        return await record_expenses(expenses, update, context)
+    await update.message.reply_text(category_prompt(pending),
+                                    reply_markup=category_keyboard(suggested_category(pending)))
+    return WAITING_FOR_CATEGORY_CHOICE
+
+
+def suggested_category(expenditure: Expenditure) -> str:
+    return classifier.suggest(expenditure.user_id, expenditure.product)[0]
+
+
+def category_prompt(expenditure: Expenditure) -> str:
+    return f"Choose a category for {expenditure.product} (${expenditure.amount:.2f}):"
+
 
 async def save_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     category = query.data
-    expenditure = context.user_data.get("expenditure")
-    if not expenditure:
+    expenses = context.user_data.get("expenses")
+    if not expenses and "expenditure" in context.user_data:
+        # Conversation persisted before messages could carry several expenses.
+        expenses = context.user_data["expenses"] = [context.user_data.pop("expenditure")]
+    pending = [e for e in expenses or [] if not e.category]
+    if not pending:
         await query.edit_message_text("An error occurred. Please start again.")
         return ConversationHandler.END
+
+    expenditure = pending[0]
     expenditure.category = category
     expenditure.set_spend_type()
-    logging.info(
-        f"Expenditure updated with category: {category} and spend type {expenditure.spend_type}")
-    await query.edit_message_text(f"Category '{category}' chosen.")
-
-    result = await write_to_spreadsheet(expenditure, update, context)
+    if not expenditure.id:
+        expenditure.id = uuid.uuid5(EXPENSE_ID_NAMESPACE, f"{update.effective_chat.id}:{query.id}").hex
+    logger.debug("Expenditure updated with category: %s and spend type %s",
+                 category, expenditure.spend_type)
+
+    if len(pending) > 1:
+        # Reuse the keyboard message for the next expense.
+        await query.edit_message_text(category_prompt(pending[1]),
+                                      reply_markup=category_keyboard(suggested_category(pending[1])))
+        return WAITING_FOR_CATEGORY_CHOICE
 
-    if result == ConversationHandler.END:
-        if "expenditure" in context.user_data:
-            del context.user_data["expenditure"]
+    await query.edit_message_text(f"Category '{category}' chosen.")
+    return await record_expenses(expenses, update, context)
 
-    return result
 
+async def record_expenses(expenses: list, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Commit the expenditures to the local ledger in one transaction and
+    confirm them to the user.
 
-async def write_to_spreadsheet(expenditure: Expenditure, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info("Save expense triggered via message.")
-    expenditure = context.user_data.get("expenditure")
-    if not expenditure:
-        await update.message.reply_text("An error occurred. Please start again.")
-        return ConversationHandler.END
+    The rows reach Google Sheets shortly after via the background syncer, so
+    a slow or failing Sheets API never makes the user retype the expense.
+    """
+    logger.debug("Saving %d expense(s)", len(expenses))
+    user_id = update.effective_user.id
     try:
-        result = await write(expenditure)
-        logging.info(f"Write result: {result}")
-
-        if result:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"Successfully saved: {expenditure}",
-                parse_mode='MarkdownV2'
-            )
-            return ConversationHandler.END
+        # Load the user's category index before these rows land in the
+        # ledger, so a first-time build does not count them twice.
+        classifier.index(user_id)
+        added = ledger.add_many(expenses)
+        if added < len(expenses):
+            logger.info("%d expense(s) were already recorded", len(expenses) - added)
         else:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Failed to save the expense. Please try entering the expense again."
-            )
-            return WAITING_FOR_EXPENSE_INPUT
+            classifier.learn(user_id, expenses)
+        syncer.notify()
     except Exception as e:
-        logging.exception("Exception while writing to spreadsheet:")
+        logger.exception("Exception while saving to the ledger:")
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text="⚠️ An error occurred while saving to the spreadsheet. Please try entering the expense again."
+            text="⚠️ An error occurred while saving the expense. Please try entering the expense again."
         )
         return WAITING_FOR_EXPENSE_INPUT
 
+    context.user_data.pop("expenses", None)
+    context.user_data.pop("selected_date", None)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Successfully saved: " + "\n".join(str(e) for e in expenses),
+        parse_mode='MarkdownV2'
+    )
+    if added == len(expenses):
+        await send_budget_alerts(update, context, expenses)
+    return ConversationHandler.END
+
+
+async def send_budget_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE, expenses: list):
+    try:
+        alerts = budgets.check(update.effective_user.id, expenses)
+    except Exception:
+        logger.exception("Budget check failed")
+        return
+    if alerts:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="\n".join(alerts))
+
+
+async def budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /budget lists this month's budgets, /budget <category or spend type> <limit>
+    sets one and a limit of 0 removes it.
+    """
+    user_id = update.effective_user.id
+    if context.args:
+        try:
+            *words, limit = context.args
+            name = budgets.set(user_id, " ".join(words), parse_amount(limit))
+        except ValueError as e:
+            await update.message.reply_text(
+                f"⚠️ {e}. Use /budget <category or spend type> <monthly limit>, "
+                "e.g. '/budget Food 400' (0 removes it).")
+            return
+        await update.message.reply_text(f"Budget for {name} updated.")
+
+    month = find_date()[:7]
+    rows = budgets.status(user_id, month)
+    if not rows:
+        await update.message.reply_text(
+            "No budgets set. Use /budget <category or spend type> <monthly limit>, e.g. '/budget Food 400'.")
+        return
+    await update.message.reply_text("\n".join(
+        [f"Budgets for {month}:"]
+        + [f"• {name}: {format_amount(spent)} of {format_amount(limit)} ({spent / limit:.0%})"
+           for name, spent, limit in rows]))
+
+
+async def recurring_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /recurring lists the user's recurring expenses, /recurring <product>
+    <amount> <category> <schedule> adds one and /recurring remove <id>
+    deletes one. Schedules are 'monthly <day>', 'weekly', 'daily' or
+    'every <n> days|weeks'.
+    """
+    user_id = update.effective_user.id
+    args = context.args or []
+    usage = ("Use /recurring <product> <amount> <category> <schedule>, e.g. "
+             "'/recurring Netflix 15.98 Subscriptions monthly 5' or "
+             "'/recurring Gym 20 Lifestyle every 2 weeks'.")
+    if len(args) == 2 and args[0].lower() == "remove":
+        removed = args[1].isdigit() and recurring.remove(user_id, int(args[1]))
+        await update.message.reply_text(f"Recurring expense #{args[1]} removed." if removed
+                                        else f"⚠️ No recurring expense #{args[1]}.")
+        return
+    if args:
+        lowered = [a.lower() for a in args]
+        if lowered[-1] in ("weekly", "daily"):
+            length = 1
+        elif len(args) >= 2 and lowered[-2] == "monthly":
+            length = 2
+        else:
+            length = 3
+        if len(args) < length + 3:
+            await update.message.reply_text(usage)
+            return
+        try:
+            *words, amount, category = args[:-length]
+            rule = recurring.add(user_id, " ".join(words), parse_amount(amount),
+                                 category, args[-length:])
+        except ValueError as e:
+            await update.message.reply_text(f"⚠️ {e}. {usage}")
+            return
+        await update.message.reply_text(
+            f"Recurring expense #{rule['id']} added: {rule['product']} "
+            f"{format_amount(rule['amount'])} ({rule['category']}), "
+            f"{describe_schedule(rule['day'], rule['interval_days'])}. "
+            f"First recorded on {rule['next_run']}.")
+        if rule["next_run"] <= find_date():
+            recurring_scheduler.notify()
+        return
+
+    rules = recurring.rules(user_id)
+    if not rules:
+        await update.message.reply_text(f"No recurring expenses. {usage}")
+        return
+    await update.message.reply_text("\n".join(
+        ["Recurring expenses:"]
+        + [f"#{r['id']} {r['product']} {format_amount(r['amount'])} ({r['category']}), "
+           f"{describe_schedule(r['day'], r['interval_days'])}, next on {r['next_run']}"
+           for r in rules]
+        + ["Remove one with /recurring remove <id>."]))
+
+
+def recurring_summary(expenses: list) -> str:
+    """MarkdownV2 summary of recorded recurring expenses, short enough for one message."""
+    total = sum(e.amount for e in expenses)
+    lines = [escape_markdown_v2(f"🔁 Recorded {len(expenses)} recurring expense(s), "
+                                f"{format_amount(total)} in total:")]
+    lines += [str(e) for e in expenses[:RECURRING_NOTIFY_LINES]]
+    if len(expenses) > RECURRING_NOTIFY_LINES:
+        lines.append(escape_markdown_v2(f"… and {len(expenses) - RECURRING_NOTIFY_LINES} more."))
+    return "\n".join(lines)
+
+
+async def on_recurring_saved(expenses: list):
+    """Sync the recorded recurring expenses, learn from them and tell their users."""
+    syncer.notify()
+    by_user = {}
+    for expenditure in expenses:
+        by_user.setdefault(expenditure.user_id, []).append(expenditure)
+    for user_id, saved in by_user.items():
+        try:
+            # A user's first index is seeded from the ledger, which already
+            # holds these rows; learning them as well would count them twice.
+            if classifier.seeded(user_id):
+                classifier.learn(user_id, saved)
+            else:
+                classifier.index(user_id)
+        except Exception:
+            logger.exception("Could not learn categories of recurring expenses")
+        try:
+            await application.bot.send_message(chat_id=user_id, text=recurring_summary(saved),
+                                               parse_mode='MarkdownV2')
+        except Exception:
+            logger.exception("Could not notify user %s of recurring expenses", user_id)
+        try:
+            alerts = budgets.check(user_id, saved)
+            if alerts:
+                await application.bot.send_message(chat_id=user_id, text="\n".join(alerts))
+        except Exception:
+            logger.exception("Could not send budget alerts to user %s", user_id)
+
+
+async def prompt_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # "/import" followed by CSV lines in the same message imports them directly.
+    _, _, text = update.message.text.partition("\n")
+    if text.strip():
+        return await import_text(update, context, text)
+    await update.message.reply_text(
+        "Send a CSV file or paste one expense per line in the format: "
+        "Date,Product,Price[,Category] (e.g. '2025-03-01,Coffee,3.50,Food')."
+    )
+    return WAITING_FOR_IMPORT
+
+
+async def receive_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.document:
+        return await import_document(update, context)
+    return await import_text(update, context, update.message.text)
+
+
+async def import_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    source = hashlib.sha256(text.encode()).hexdigest()
+    return await run_import(update, context, text.splitlines(), source)
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Download an uploaded CSV to a temporary file and stream it into the ledger."""
+    document = update.message.document
+    await update.message.reply_text("Importing... ⏳")
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+        except Exception:
+            logger.exception("Could not download the import file")
+            await update.message.reply_text(
+                "⚠️ Could not download the file. Please send it again.")
+            return WAITING_FOR_IMPORT
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return await run_import(update, context, f, document.file_unique_id)
+    except UnicodeDecodeError:
+        await update.message.reply_text("⚠️ The file is not UTF-8 text. Please send a CSV file.")
+        return WAITING_FOR_IMPORT
+    finally:
+        os.remove(path)
+
+
+async def run_import(update: Update, context: ContextTypes.DEFAULT_TYPE, lines, source: str):
+    try:
+        report = await import_expenses(lines, ledger, update.effective_user.id, source,
+                                       classifier=classifier)
+    except Exception:
+        logger.exception("Import failed")
+        await update.message.reply_text(
+            "⚠️ An error occurred while importing. Rows imported so far are kept; "
+            "sending the same input again skips them."
+        )
+        return ConversationHandler.END
+    if report.imported:
+        syncer.notify()
+    await update.message.reply_text(report.summary())
+    return ConversationHandler.END
+
 # Calendar handler to display the calendar
 
 
@@ -182,26 +438,30 @@ async def calendar_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 async def inline_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
-    await query.answer()
-
-    selected, date = telegramcalendar.process_calendar_selection(None, update)
+    selected, date = await telegramcalendar.process_calendar_selection(update, context)
     if selected:
-        await query.edit_message_text(
-            text=f"You selected {date.strftime('%d/%m/%Y')}",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await query.edit_message_text(text=f"You selected {date.strftime('%d/%m/%Y')}")
         return ConversationHandler.END
     return SELECTING_DATE
 
-# Retrieve insights from google sheets
+# Retrieve insights from the ledger, or google sheets
 async def retrieve_insights(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        months, title = parse_period(" ".join(context.args or []))
+    except ValueError as e:
+        await update.message.reply_text(
+            f"⚠️ {e}. Use /insights, /insights 2025-03, /insights ytd or /insights last 3.")
+        return
+
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=f"Retrieving insights... 📊"
     )
 
     try:
-        insights = get_insights()
+        user_id = update.effective_user.id
+        insights = await period_insights(ledger, tenant_for(user_id), user_id, months)
+        insights["title"] = title
         message = format_insights_message(insights)
 
         await context.bot.send_message(
@@ -211,7 +471,7 @@ async def retrieve_insights(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     except Exception as e:
-        logging.exception("Failed to retrieve insights")
+        logger.exception("Failed to retrieve insights")
 
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
@@ -225,6 +485,7 @@ async def retrieve_insights(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.pop("selected_date", None)
     await update.message.reply_text('Operation cancelled.')
     return ConversationHandler.END
 
@@ -232,62 +493,251 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Deployment
 app = FastAPI()
 TOKEN = import_token()
-logging.info(f"got the token in main! {TOKEN}")
-application = ApplicationBuilder().token(TOKEN).build()
+# Alternative Bot API root, e.g. a local Bot API server or a benchmark fake.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+ledger = Ledger()
+classifier = CategoryClassifier(ledger.conn)
+budgets = Budgets(ledger.conn)
+syncer = LedgerSyncer(ledger, sync_rows, tenant_for)
+recurring = RecurringExpenses(ledger.conn)
+recurring_scheduler = RecurringScheduler(recurring, ledger, on_saved=on_recurring_saved)
+credential_refresher = CredentialRefresher(sheets_pool.credentials)
+
+
+async def on_application_init(application):
+    credential_refresher.start()
+    syncer.start()
+    recurring_scheduler.start()
+
+
+async def on_application_shutdown(application):
+    await recurring_scheduler.stop()
+    await syncer.stop()
+    await credential_refresher.stop()
+    await drain()
+
+BOT_API_SECONDS = metrics.histogram(
+    "cashbotic_bot_api_request_seconds",
+    "Duration of each Telegram Bot API request, by method.", ("method",))
+_BOT_API_METHOD_RE = re.compile(r"[A-Za-z]+")
+
+
+def bot_api_label(url: str) -> str:
+    """The Bot API method of a request URL, or "file" for file downloads."""
+    name = url.rsplit("/", 1)[-1]
+    # File URLs end in the file's path (e.g. documents/file_3.csv); labelling
+    # them by it would add a series per downloaded file.
+    if "/file/bot" in url or not _BOT_API_METHOD_RE.fullmatch(name):
+        return "file"
+    return name
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest timing every Bot API call by its method name."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with metrics.timed(BOT_API_SECONDS, bot_api_label(url)):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+application = (ApplicationBuilder().token(TOKEN)
+               .base_url(TELEGRAM_API_URL)
+               .request(InstrumentedRequest(connection_pool_size=256))
+               .persistence(build_persistence(ledger.conn))
+               .post_init(on_application_init)
+               .post_shutdown(on_application_shutdown)
+               .build())
 
 oneoff_handler = ConversationHandler(
-    entry_points=[CommandHandler('oneoff', prompt_product_price)],
+    entry_points=[CommandHandler('oneoff', oneoff_command)],
     states={
         WAITING_FOR_EXPENSE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, validate_and_prompt_category)],
-        WAITING_FOR_CATEGORY_CHOICE: [CallbackQueryHandler(save_expense)],
+        WAITING_FOR_CATEGORY_CHOICE: [CallbackQueryHandler(save_expense, pattern=CATEGORY_PATTERN)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
-    per_message=False
+    per_message=False,
+    name="oneoff",
+    persistent=True
 )
 
 calendar_conversation = ConversationHandler(
     entry_points=[CommandHandler('calendar', calendar_handler)],
     states={
-        SELECTING_DATE: [CallbackQueryHandler(inline_handler)]
+        SELECTING_DATE: [CallbackQueryHandler(inline_handler, pattern=telegramcalendar.CALLBACK_PATTERN)]
     },
-    fallbacks=[CommandHandler('cancel', cancel)]
+    fallbacks=[CommandHandler('cancel', cancel)],
+    name="calendar",
+    persistent=True
 )
 
 past_handler = ConversationHandler(
     entry_points=[CommandHandler('past', calendar_handler)],
     states={
-        SELECTING_DATE: [CallbackQueryHandler(store_date_and_prompt_price)],
+        SELECTING_DATE: [CallbackQueryHandler(store_date_and_prompt_price,
+                                              pattern=telegramcalendar.CALLBACK_PATTERN)],
         WAITING_FOR_EXPENSE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, validate_and_prompt_category)],
-        WAITING_FOR_CATEGORY_CHOICE: [CallbackQueryHandler(save_expense)],
+        WAITING_FOR_CATEGORY_CHOICE: [CallbackQueryHandler(save_expense, pattern=CATEGORY_PATTERN)],
     },
     fallbacks=[CommandHandler('cancel', cancel)],
-    per_message=False
+    per_message=False,
+    name="past",
+    persistent=True
+)
+
+import_handler = ConversationHandler(
+    entry_points=[CommandHandler('import', prompt_import)],
+    states={
+        WAITING_FOR_IMPORT: [MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.Document.ALL,
+                                            receive_import)],
+    },
+    fallbacks=[CommandHandler('cancel', cancel)],
+    per_message=False,
+    name="import",
+    persistent=True
 )
 
 start_handler = CommandHandler('start', start_message)
 insights_handler = CommandHandler('insights', retrieve_insights)
+budget_handler = CommandHandler('budget', budget_command)
+recurring_handler = CommandHandler('recurring', recurring_command)
 # past_handler = CommandHandler('past', past_command)
 application.add_handler(calendar_conversation)
 
 application.add_handler(start_handler)
 application.add_handler(oneoff_handler)
 application.add_handler(past_handler)
+application.add_handler(import_handler)
 application.add_handler(insights_handler)
+application.add_handler(budget_handler)
+application.add_handler(recurring_handler)
+
+dispatcher = UpdateDispatcher(application.process_update)
+deduplicator = UpdateDeduplicator(int(TOKEN.split(":")[0]),
+                                  conn=ledger.conn if os.getenv("DEDUP_PERSIST", "1") == "1" else None)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+metrics.gauge("cashbotic_update_queue_depth", "Updates waiting for a worker.",
+              lambda: dispatcher.stats()["queue_depth"])
+metrics.gauge("cashbotic_unsynced_rows", "Ledger rows not yet replicated to Sheets.",
+              lambda: ledger.sync_lag()["unsynced"])
+metrics.gauge("cashbotic_sync_lag_seconds", "Age of the oldest unsynced ledger row.",
+              lambda: ledger.sync_lag()["lag_seconds"])
+readiness = {"telegram": False, "sheets": False}
 
 
 @app.on_event("startup")
 async def on_startup():
-    await application.initialize()
+    phases = {"imports": time.perf_counter() - STARTED_AT}
+
+    async def timed(name, coro):
+        started = time.perf_counter()
+        await coro
+        phases[name] = time.perf_counter() - started
+
+    # Google credentials and sheet metadata load alongside Telegram's
+    # initialisation. A Sheets failure only delays readiness (the client is
+    # built lazily on first use) instead of crashing the container.
+    telegram_result, sheets_result = await asyncio.gather(
+        timed("telegram", application.initialize()),
+        timed("sheets", warm_up()),
+        return_exceptions=True,
+    )
+    if isinstance(telegram_result, Exception):
+        raise telegram_result
+    if isinstance(sheets_result, Exception):
+        logger.error("Sheets warm-up failed, will retry on first use: %s", sheets_result)
+    else:
+        readiness["sheets"] = True
+
+    # Runs the periodic persistence updates; updates still arrive via the webhook.
+    await timed("application", application.start())
+    await on_application_init(application)
+    dispatcher.start()
+    readiness["telegram"] = True
+    logger.info("Startup finished: %s", ", ".join(
+        f"{name} {seconds:.3f}s" for name, seconds in phases.items()))
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await dispatcher.stop()
+    # Stopping writes any pending conversation state to the persistence.
+    await application.stop()
+    await on_application_shutdown(application)
+    await application.shutdown()
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
-    logger.info("📩 Webhook hit by Telegram")
-    data = await request.json()
-    update = Update.de_json(data, application.bot)
-    await application.process_update(update)
+    """
+    Validate and queue the update, then acknowledge it straight away.
+
+    Processing happens in the dispatcher's workers, so Telegram never waits on
+    our handlers. When the queue stays full we answer 503 and Telegram
+    redelivers the update later.
+    """
+    with metrics.span("webhook"):
+        return await _accept_update(request)
+
+
+async def _accept_update(request: Request):
+    logger.debug("📩 Webhook hit by Telegram")
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return Response(status_code=403)
+    try:
+        data = await request.json()
+        with metrics.span("update_parse"):
+            update = Update.de_json(data, application.bot)
+    except Exception:
+        logger.warning("Ignoring malformed webhook payload")
+        return Response(status_code=400)
+    if update is None:
+        return Response(status_code=400)
+
+    if not deduplicator.check_and_add(update.update_id):
+        logger.info("Dropping redelivered update %s", update.update_id)
+        return {"ok": True}
+    if not await dispatcher.submit(update):
+        deduplicator.forget(update.update_id)
+        return Response(status_code=503)
     return {"ok": True}
 
 
+@app.get("/ready")
+async def ready():
+    """200 once the bot can process updates and the Sheets client is warm."""
+    if not readiness["sheets"]:
+        try:
+            await warm_up()
+            readiness["sheets"] = True
+        except Exception:
+            logger.warning("Sheets backend still not ready", exc_info=True)
+    status = 200 if all(readiness.values()) else 503
+    return JSONResponse(readiness, status_code=status)
+
+
+@app.get("/stats")
+async def stats():
+    """Queue, sync and Sheets counters for monitoring."""
+    return {
+        "updates": dispatcher.stats(),
+        "deduplication": deduplicator.stats(),
+        "ledger_sync": syncer.stats(),
+        "recurring": recurring_scheduler.stats(),
+        "sheets_writes": write_stats(),
+        "sheets_requests": sheets_scheduler.stats(),
+        "google_credentials": credential_stats(),
+        "sheets_services": sheets_pool.stats(),
+        "insights_cache": insights_cache_stats(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(),
+                             media_type="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
     if os.getenv("ENV") == "local":
         application.run_polling()
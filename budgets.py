@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import logging
+
+from insights import format_amount
+from utils import CATEGORY_TO_SPEND_TYPE_DEFAULT, find_category
+
+logger = logging.getLogger(__name__)
+
+BUDGET_THRESHOLDS = sorted(float(t) for t in os.getenv("BUDGET_THRESHOLDS", "0.8,1").split(","))
+
+# Budgets can be set on a category or on a spend type, except on income.
+_SPEND_TYPE_NAMES = {s.lower(): s for s in CATEGORY_TO_SPEND_TYPE_DEFAULT.values()
+                     if s != "Income"}
+
+
+def budget_name(text: str) -> tuple[str, str]:
+    """
+    Resolve a category or spend type name typed by the user.
+
+    Returns:
+        tuple: ("category" or "spend_type", canonical name).
+
+    Raises:
+        ValueError: If `text` is neither.
+    """
+    category = find_category(text)
+    if category and category != "Income":
+        return "category", category
+    key = text.strip().lower()
+    if key in _SPEND_TYPE_NAMES:
+        return "spend_type", _SPEND_TYPE_NAMES[key]
+    raise ValueError(f"unknown category or spend type {text!r}")
+
+
+class Budgets:
+    """
+    Monthly spending limits per category or spend type.
+
+    Spending is read from the ledger's running totals, so checking a budget
+    after a save is a local lookup, never a Sheets read.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        """
+        Args:
+            conn: The ledger's sqlite3 connection.
+        """
+        self.conn = conn
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS budgets ("
+                         "user_id INTEGER NOT NULL, name TEXT NOT NULL, "
+                         "scope TEXT NOT NULL, monthly_limit REAL NOT NULL, "
+                         "PRIMARY KEY (user_id, name))")
+
+    def set(self, user_id, name: str, limit: float) -> str:
+        """
+        Set (or with a limit of 0, remove) a budget; return its canonical name.
+
+        Raises:
+            ValueError: If the name is unknown or the limit is negative.
+        """
+        if limit < 0:
+            raise ValueError("the limit cannot be negative")
+        scope, name = budget_name(name)
+        with self.conn:
+            if limit > 0:
+                self.conn.execute("INSERT OR REPLACE INTO budgets VALUES (?, ?, ?, ?)",
+                                  (user_id, name, scope, limit))
+            else:
+                self.conn.execute("DELETE FROM budgets WHERE user_id = ? AND name = ?",
+                                  (user_id, name))
+        return name
+
+    def spent(self, user_id, scope: str, name: str, month: str) -> float:
+        """Spending of a month (yyyy-mm) against one budget."""
+        (amount,) = self.conn.execute(
+            f"SELECT COALESCE(SUM(amount), 0) FROM aggregates "
+            f"WHERE user_id = ? AND month = ? AND {scope} = ?",
+            (user_id, month, name)).fetchone()
+        return amount
+
+    def status(self, user_id, month: str) -> list[tuple]:
+        """(name, spent, limit) of every budget of the user."""
+        return [(name, self.spent(user_id, scope, name, month), limit)
+                for name, scope, limit in self.conn.execute(
+                    "SELECT name, scope, monthly_limit FROM budgets "
+                    "WHERE user_id = ? ORDER BY name", (user_id,))]
+
+    def check(self, user_id, expenses) -> list[str]:
+        """
+        Alerts for the thresholds that newly saved `expenses` crossed.
+
+        Call after the expenses were committed: the running totals already
+        include them, so the spending before them is the total minus their
+        share.
+        """
+        budgets = self.conn.execute(
+            "SELECT name, scope, monthly_limit FROM budgets WHERE user_id = ?",
+            (user_id,)).fetchall()
+        if not budgets:
+            return []
+
+        added = {}
+        for e in expenses:
+            month = e.date[:7]
+            for scope, value in (("category", e.category), ("spend_type", e.spend_type)):
+                added[(month, scope, value)] = added.get((month, scope, value), 0.0) + e.amount
+
+        alerts = []
+        for name, scope, limit in budgets:
+            for (month, s, value), amount in added.items():
+                if s != scope or value != name or amount <= 0:
+                    continue
+                after = self.spent(user_id, scope, name, month)
+                before = after - amount
+                crossed = [t for t in BUDGET_THRESHOLDS if before < t * limit <= after]
+                if crossed:
+                    alerts.append(budget_alert(name, after, limit, month))
+        return alerts
+
+
+def budget_alert(name: str, spent: float, limit: float, month: str) -> str:
+    icon = "🚨" if spent >= limit else "⚠️"
+    return (f"{icon} {name}: {format_amount(spent)} of {format_amount(limit)} "
+            f"({spent / limit:.0%}) spent in {month}.")
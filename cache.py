@@ -0,0 +1,44 @@
+import time
+
+
+class TTLCache:
+    """
+    Small in-process cache whose entries expire `ttl` seconds after being set.
+
+    Entries can also be dropped early with `invalidate`. Hit and miss counts
+    are kept so the cache's usefulness can be monitored.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        Args:
+            ttl (float): Lifetime of an entry in seconds.
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.monotonic() < expires_at:
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
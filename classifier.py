@@ -0,0 +1,141 @@
+import os
+import re
+import sqlite3
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_AUTO_CONFIDENCE = float(os.getenv("CATEGORY_AUTO_CONFIDENCE", "0.9"))
+CATEGORY_MIN_SAMPLES = int(os.getenv("CATEGORY_MIN_SAMPLES", "3"))
+CATEGORY_CACHE_USERS = int(os.getenv("CATEGORY_CACHE_USERS", "1000"))
+
+# The whole product name is a token of its own and outweighs single words.
+EXACT_WEIGHT = 2.0
+_WORD_RE = re.compile(r"[^\W\d_]{2,}")
+
+
+def tokenize(product: str) -> list[str]:
+    """The product's normalised name, prefixed with '=', and its words."""
+    name = " ".join(product.lower().split())
+    return [f"={name}", *dict.fromkeys(_WORD_RE.findall(name))]
+
+
+class CategoryClassifier:
+    """
+    Per-user token → category frequency index predicting an expense's category.
+
+    Counts live in SQLite and are loaded into memory per user on first use;
+    only the `cache_users` most recently active users are kept. A user's
+    index is seeded from their past ledger rows the first time it is built.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, cache_users: int = CATEGORY_CACHE_USERS):
+        """
+        Args:
+            conn: The ledger's sqlite3 connection.
+            cache_users (int): Number of user indexes kept in memory.
+        """
+        self.conn = conn
+        self.cache_users = cache_users
+        self._indexes = OrderedDict()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS category_tokens ("
+                         "user_id INTEGER NOT NULL, token TEXT NOT NULL, "
+                         "category TEXT NOT NULL, count INTEGER NOT NULL, "
+                         "PRIMARY KEY (user_id, token, category))")
+            conn.execute("CREATE TABLE IF NOT EXISTS category_index_users ("
+                         "user_id INTEGER PRIMARY KEY)")
+
+    def index(self, user_id) -> dict:
+        """Return the user's {token: {category: count}} index, loading it if needed."""
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+
+        if self.conn.execute("SELECT 1 FROM category_index_users WHERE user_id = ?",
+                             (user_id,)).fetchone() is None:
+            self._seed(user_id)
+        index = {}
+        for token, category, count in self.conn.execute(
+                "SELECT token, category, count FROM category_tokens WHERE user_id = ?",
+                (user_id,)):
+            index.setdefault(token, {})[category] = count
+        self._indexes[user_id] = index
+        if len(self._indexes) > self.cache_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    def seeded(self, user_id) -> bool:
+        """Whether the user's counts were already built from the ledger."""
+        return user_id in self._indexes or self.conn.execute(
+            "SELECT 1 FROM category_index_users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def _seed(self, user_id) -> None:
+        """Build a user's counts from the expenses already in the ledger."""
+        counts = {}
+        for product, category, n in self.conn.execute(
+                "SELECT product, category, COUNT(*) FROM expenses "
+                "WHERE user_id = ? AND category != '' GROUP BY product, category",
+                (user_id,)):
+            for token in tokenize(product):
+                counts[(token, category)] = counts.get((token, category), 0) + n
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO category_tokens VALUES (?, ?, ?, ?)",
+                [(user_id, token, category, n) for (token, category), n in counts.items()])
+            self.conn.execute("INSERT OR IGNORE INTO category_index_users VALUES (?)",
+                              (user_id,))
+
+    def predict(self, user_id, product: str) -> tuple[str, float, int]:
+        """
+        Guess the category of `product` from the user's history.
+
+        Returns:
+            tuple: (category or "", confidence between 0 and 1, number of
+            past expenses behind the guess).
+        """
+        index = self.index(user_id)
+        scores = {}
+        support = 0
+        for token in tokenize(product):
+            counts = index.get(token)
+            if not counts:
+                continue
+            total = sum(counts.values())
+            weight = EXACT_WEIGHT if token[0] == "=" else 1.0
+            for category, n in counts.items():
+                scores[category] = scores.get(category, 0.0) + weight * n / total
+            support = max(support, total)
+        if not scores:
+            return "", 0.0, 0
+        best = max(scores, key=scores.get)
+        return best, scores[best] / sum(scores.values()), support
+
+    def suggest(self, user_id, product: str) -> tuple[str, bool]:
+        """
+        Returns:
+            tuple: (predicted category or "", whether it is confident enough
+            to apply without asking).
+        """
+        category, confidence, support = self.predict(user_id, product)
+        confident = confidence >= CATEGORY_AUTO_CONFIDENCE and support >= CATEGORY_MIN_SAMPLES
+        return category, confident
+
+    def learn(self, user_id, expenses) -> None:
+        """Count the categories of newly saved expenses."""
+        index = self.index(user_id)
+        updates = []
+        for expenditure in expenses:
+            if not expenditure.category:
+                continue
+            for token in tokenize(expenditure.product):
+                counts = index.setdefault(token, {})
+                counts[expenditure.category] = counts.get(expenditure.category, 0) + 1
+                updates.append((user_id, token, expenditure.category))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO category_tokens VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (user_id, token, category) DO UPDATE SET count = count + 1",
+                updates)
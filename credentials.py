@@ -0,0 +1,166 @@
+import os
+import base64
+import pickle
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from datetime import datetime, timedelta
+
+import httplib2
+import google_auth_httplib2
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_DIR = os.getenv("TOKEN_CACHE_DIR", ".token_cache")
+REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+REFRESH_CHECK_INTERVAL = float(os.getenv("TOKEN_REFRESH_CHECK_INTERVAL", "60"))
+
+# Credentials -> environment variable they were loaded from, for the cache.
+_sources = weakref.WeakKeyDictionary()
+_locks = weakref.WeakKeyDictionary()
+_locks_guard = threading.Lock()
+refreshes = 0
+refresh_failures = 0
+
+
+def _cache_path(token_env: str) -> str:
+    return os.path.join(TOKEN_CACHE_DIR, f"{token_env}.pickle")
+
+
+def load_google_credentials(token_env: str = "GOOGLE_TOKEN_PICKLE_B64"):
+    """
+    Load Google OAuth credentials from Railway environment variable.
+
+    A token refreshed by a previous run is reused from the local token cache,
+    unless the environment variable has changed since it was cached.
+    """
+    b64 = os.environ.get(token_env)
+    if not b64:
+        raise RuntimeError(f"{token_env} not set")
+
+    source = hashlib.sha256(b64.encode()).hexdigest()
+    try:
+        with open(_cache_path(token_env), "rb") as f:
+            cached_source, creds = pickle.load(f)
+        if cached_source == source:
+            logger.info("Loading Google credentials for %s from token cache", token_env)
+            _sources[creds] = token_env
+            return creds
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("Ignoring unreadable token cache for %s", token_env, exc_info=True)
+
+    logger.info("Loading Google credentials from environment variable %s", token_env)
+
+    token_bytes = base64.b64decode(b64)
+    creds = pickle.loads(token_bytes)
+    _sources[creds] = token_env
+    return creds
+
+
+def _save(creds) -> None:
+    """Atomically write refreshed credentials to the token cache."""
+    token_env = _sources.get(creds)
+    b64 = os.environ.get(token_env or "")
+    if not b64:
+        return
+    os.makedirs(TOKEN_CACHE_DIR, exist_ok=True)
+    path = _cache_path(token_env)
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump((hashlib.sha256(b64.encode()).hexdigest(), creds), f)
+    os.replace(tmp, path)
+
+
+def _refreshable(creds) -> bool:
+    return getattr(creds, "refresh_token", None) is not None or hasattr(creds, "signer")
+
+
+def expires_soon(creds, margin: float = REFRESH_MARGIN) -> bool:
+    expiry = getattr(creds, "expiry", None)
+    if not _refreshable(creds):
+        return False
+    if expiry is None:
+        return not creds.token
+    # google-auth keeps expiry as a naive UTC datetime.
+    return expiry - timedelta(seconds=margin) <= datetime.utcnow()
+
+
+def ensure_fresh(creds, margin: float = 0) -> None:
+    """
+    Refresh `creds` if it expires within `margin` seconds. Blocking.
+
+    Callers racing on the same credentials share one refresh: the others wait
+    for it and then find the token fresh.
+    """
+    global refreshes, refresh_failures
+    if not expires_soon(creds, margin):
+        return
+    with _locks_guard:
+        lock = _locks.setdefault(creds, threading.Lock())
+    with lock:
+        if not expires_soon(creds, margin):
+            return
+        try:
+            creds.refresh(google_auth_httplib2.Request(httplib2.Http()))
+        except Exception:
+            refresh_failures += 1
+            raise
+        refreshes += 1
+        logger.info("Refreshed Google credentials, valid until %s", creds.expiry)
+        try:
+            _save(creds)
+        except OSError:
+            logger.warning("Could not write token cache", exc_info=True)
+
+
+class CredentialRefresher:
+    """
+    Background task refreshing pooled credentials before they expire, so no
+    user request has to wait for the token round trip.
+    """
+
+    def __init__(self, credentials, interval: float = REFRESH_CHECK_INTERVAL,
+                 margin: float = REFRESH_MARGIN):
+        """
+        Args:
+            credentials: Function returning the credentials currently in use.
+            interval (float): Seconds between expiry checks.
+            margin (float): Refresh credentials expiring within this many seconds.
+        """
+        self._credentials = credentials
+        self.interval = interval
+        self.margin = margin
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh_due(self) -> None:
+        loop = asyncio.get_running_loop()
+        for creds in self._credentials():
+            if expires_soon(creds, self.margin):
+                try:
+                    await loop.run_in_executor(None, ensure_fresh, creds, self.margin)
+                except Exception:
+                    logger.exception("Proactive credential refresh failed")
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh_due()
+            await asyncio.sleep(self.interval)
+
+
+def stats() -> dict:
+    return {"refreshes": refreshes, "refresh_failures": refresh_failures}
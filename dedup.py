@@ -0,0 +1,90 @@
+import os
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "10000"))
+
+
+class UpdateDeduplicator:
+    """
+    Remembers the last `capacity` update IDs of a bot to drop redeliveries.
+
+    IDs live in a ring buffer (for eviction order) plus a set (for O(1)
+    lookups). With a ledger connection the IDs are also persisted, so replays
+    arriving just after a restart are still recognised.
+    """
+
+    def __init__(self, bot_id: int, capacity: int = DEDUP_CAPACITY, conn=None):
+        """
+        Args:
+            bot_id (int): Bot the update IDs belong to.
+            capacity (int): Number of recent update IDs to remember.
+            conn: Optional sqlite3 connection to persist seen IDs in.
+        """
+        self.bot_id = bot_id
+        self._order = deque(maxlen=capacity)
+        self._seen = set()
+        self._conn = conn
+        self.duplicates = 0
+        if conn is not None:
+            self._load()
+
+    def _load(self) -> None:
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_updates ("
+                "bot_id INTEGER NOT NULL, update_id INTEGER NOT NULL, "
+                "seen_at REAL NOT NULL, PRIMARY KEY (bot_id, update_id))")
+        rows = self._conn.execute(
+            "SELECT update_id FROM processed_updates WHERE bot_id = ? "
+            "ORDER BY update_id DESC LIMIT ?",
+            (self.bot_id, self._order.maxlen)).fetchall()
+        for (update_id,) in reversed(rows):
+            self._remember(update_id)
+
+    def _remember(self, update_id: int) -> None:
+        if len(self._order) == self._order.maxlen:
+            self._seen.discard(self._order[0])
+        self._order.append(update_id)
+        self._seen.add(update_id)
+
+    def check_and_add(self, update_id: int) -> bool:
+        """Record `update_id`; return False if it was already seen."""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return False
+        self._remember(update_id)
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO processed_updates VALUES (?, ?, ?)",
+                    (self.bot_id, update_id, time.time()))
+                # Keep the table to roughly the in-memory window.
+                self._conn.execute(
+                    "DELETE FROM processed_updates WHERE bot_id = ? AND update_id <= ?",
+                    (self.bot_id, update_id - self._order.maxlen))
+        return True
+
+    def forget(self, update_id: int) -> None:
+        """Undo `check_and_add` for an update that was not accepted after all."""
+        if update_id not in self._seen:
+            return
+        self._seen.discard(update_id)
+        # Drop it from the ring buffer too: if it arrives again it is
+        # appended anew, and evicting the stale copy would forget the live one.
+        # It is normally the most recent entry.
+        if self._order and self._order[-1] == update_id:
+            self._order.pop()
+        else:
+            self._order.remove(update_id)
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM processed_updates WHERE bot_id = ? AND update_id = ?",
+                    (self.bot_id, update_id))
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._seen), "duplicates": self.duplicates}
@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import logging
+
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv("WEBHOOK_ENQUEUE_TIMEOUT", "2"))
+
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "cashbotic_update_queue_wait_seconds",
+    "Time updates spend queued before a worker picks them up.")
+
+
+class UpdateDispatcher:
+    """
+    Pool of async workers processing Telegram updates off the webhook request.
+
+    Updates are sharded by chat, so each chat's updates are handled one at a
+    time and in arrival order (keeping its conversation state consistent)
+    while different chats progress in parallel. Each worker has a bounded
+    queue; when it is full `submit` waits briefly and then reports the update
+    as rejected so the webhook can ask Telegram to redeliver it later.
+    """
+
+    def __init__(self, process, workers: int = WEBHOOK_WORKERS,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE):
+        """
+        Args:
+            process: Coroutine function handling one update.
+            workers (int): Number of worker tasks (and queues).
+            queue_size (int): Maximum updates waiting per worker.
+        """
+        self._process = process
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._workers = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.process_seconds_total = 0.0
+        self.process_seconds_max = 0.0
+
+    def start(self) -> None:
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._work(q)) for q in self._queues]
+
+    async def stop(self) -> None:
+        """Finish the updates already queued, then stop the workers."""
+        await asyncio.gather(*(q.join() for q in self._queues))
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _queue_for(self, update: Update) -> asyncio.Queue:
+        if update.effective_chat:
+            key = update.effective_chat.id
+        elif update.effective_user:
+            key = update.effective_user.id
+        else:
+            key = update.update_id
+        return self._queues[hash(key) % len(self._queues)]
+
+    async def submit(self, update: Update, timeout: float = WEBHOOK_ENQUEUE_TIMEOUT) -> bool:
+        """Queue an update; return False if its worker stayed full for `timeout`."""
+        queue = self._queue_for(update)
+        try:
+            await asyncio.wait_for(queue.put((update, time.monotonic())), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Update queue full, rejecting update %s", update.update_id)
+            return False
+        return True
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            update, queued_at = await queue.get()
+            started = time.monotonic()
+            QUEUE_WAIT_SECONDS.observe(started - queued_at)
+            try:
+                with metrics.span("dispatch"):
+                    await self._process(update)
+            except Exception:
+                self.failed += 1
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                elapsed = time.monotonic() - started
+                self.processed += 1
+                self.wait_seconds_total += started - queued_at
+                self.process_seconds_total += elapsed
+                self.process_seconds_max = max(self.process_seconds_max, elapsed)
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth and processing latency counters."""
+        n = self.processed
+        return {
+            "queue_depth": sum(q.qsize() for q in self._queues),
+            "max_queue_depth": max(q.qsize() for q in self._queues),
+            "processed": n,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.wait_seconds_total / n if n else 0.0,
+            "avg_process_seconds": self.process_seconds_total / n if n else 0.0,
+            "max_process_seconds": self.process_seconds_max,
+        }
@@ -1,8 +1,10 @@
 from utils import escape_markdown_v2, CATEGORY_TO_SPEND_TYPE_DEFAULT
 
 class Expenditure:
-    def __init__(self, product="", amount="", date="", category=""):
+    def __init__(self, product="", amount="", date="", category="", user_id=None):
         """Initialize an expenditure object."""
+        self.id = ""
+        self.user_id = user_id
         self.product = product
         self.amount = float(f"{amount:.2f}") if isinstance(amount, (int, float)) else float(amount)
         self.category = category
@@ -0,0 +1,65 @@
+import re
+
+from expenditure import Expenditure
+from utils import CATEGORIES, CURRENCY_SYMBOLS, find_category, find_date, parse_amount, parse_date
+
+_DATE = r"(?P<date>\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}(?:/\d{2}(?:\d{2})?)?)"
+_AMOUNT = (rf"(?P<amount>[-+]?[{CURRENCY_SYMBOLS}]?\s?[-+]?"
+           r"(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?)")
+_CATEGORY = rf"(?P<category>{'|'.join(map(re.escape, CATEGORIES))})"
+
+# One expense: [date] product amount [category]. The product is matched
+# lazily, so the amount is whatever follows its last separator: this keeps
+# hyphens inside names ("Coca-Cola-2.50") apart from the separator. A hyphen
+# after a space and right before the number is a minus sign ("refund -5").
+ITEM_RE = re.compile(
+    rf"^(?:{_DATE}[\s-]+)?(?P<product>.*?\S)(?:-\s*|\s+-\s+|\s+){_AMOUNT}(?:\s+{_CATEGORY})?$",
+    re.IGNORECASE,
+)
+SEPARATOR_RE = re.compile(r"[\n;]")
+
+
+def parse_expense(item: str, date: str | None = None) -> Expenditure:
+    """
+    Parse one expense such as 'Coffee-3.50', 'coffee $3.5 food' or
+    '12/03 Coca-Cola 2.50'.
+
+    Args:
+        item (str): One expense.
+        date (str): Date (yyyy-mm-dd) to use when the item has none; today
+            by default.
+
+    Returns:
+        Expenditure: The expense, with its category set if one was given.
+
+    Raises:
+        ValueError: If the item does not match the expected format.
+    """
+    match = ITEM_RE.match(item.strip())
+    if match is None:
+        raise ValueError(f"cannot read {item.strip()!r}")
+    expense_date = parse_date(match["date"]) if match["date"] else date or find_date()
+    expenditure = Expenditure(match["product"].strip(), parse_amount(match["amount"]),
+                              expense_date)
+    if match["category"]:
+        expenditure.category = find_category(match["category"])
+        expenditure.set_spend_type()
+    return expenditure
+
+
+def parse_expenses(text: str, date: str | None = None) -> tuple[list[Expenditure], list[str]]:
+    """
+    Parse every expense of a message, one per line or separated by ';'.
+
+    Returns:
+        tuple: The parsed expenses and an error message per unreadable item.
+    """
+    expenses, errors = [], []
+    for item in SEPARATOR_RE.split(text):
+        if not item.strip():
+            continue
+        try:
+            expenses.append(parse_expense(item, date))
+        except ValueError as e:
+            errors.append(str(e))
+    return expenses, errors
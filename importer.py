@@ -0,0 +1,213 @@
+import os
+import csv
+import time
+import uuid
+import asyncio
+import logging
+from collections import Counter
+
+from expenditure import Expenditure
+from ledger import Ledger
+from utils import find_category, find_month, parse_amount, parse_date
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "1000"))
+MAX_REPORTED_ERRORS = 10
+MAX_KNOWN_PRODUCTS = 10000
+
+# Namespace for import row IDs: re-importing the same file maps every line
+# to the row it created the first time.
+IMPORT_ID_NAMESPACE = uuid.UUID("0c7d3a52-58e4-4b8e-8d0f-3c6a2b9e71d4")
+
+COLUMN_NAMES = {
+    "date": "date",
+    "product": "product",
+    "description": "product",
+    "item": "product",
+    "price": "amount",
+    "amount": "amount",
+    "category": "category",
+}
+DEFAULT_COLUMNS = {"date": 0, "product": 1, "amount": 2, "category": 3}
+
+
+def _header_columns(fields: list) -> dict | None:
+    """Map column roles to positions if `fields` is a header row."""
+    columns = {}
+    for i, name in enumerate(fields):
+        role = COLUMN_NAMES.get(name.strip().lower())
+        if role and role not in columns:
+            columns[role] = i
+    if {"date", "product", "amount"} <= columns.keys():
+        return columns
+    return None
+
+
+def read_rows(lines):
+    """
+    Yield (line number, columns, fields) for each non-empty CSV row of `lines`.
+
+    An optional header row naming the columns (date, product/description,
+    amount/price, category) is consumed and used to pick the columns; without
+    one the order is date, product, amount[, category].
+    """
+    columns = None
+    reader = csv.reader(lines)
+    for fields in reader:
+        if not any(f.strip() for f in fields):
+            continue
+        if columns is None:
+            columns = _header_columns(fields)
+            if columns is not None:
+                continue
+            columns = DEFAULT_COLUMNS
+        yield reader.line_num, columns, fields
+
+
+def parse_row(columns: dict, fields: list, user_id) -> Expenditure:
+    """
+    Build an Expenditure from one CSV row.
+
+    Raises:
+        ValueError: If a required field is missing or malformed.
+    """
+    def field(role):
+        i = columns.get(role)
+        return fields[i].strip() if i is not None and i < len(fields) else ""
+
+    product = field("product")
+    if not product:
+        raise ValueError("missing product")
+    expenditure = Expenditure(product, parse_amount(field("amount")),
+                              parse_date(field("date")), user_id=user_id)
+    category = field("category")
+    if category:
+        expenditure.category = find_category(category)
+        if expenditure.category is None:
+            raise ValueError(f"unknown category {category!r}")
+    return expenditure
+
+
+class ImportReport:
+    """Counters and the first few errors of one import."""
+
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0
+        self.uncategorised = 0
+        self.error_count = 0
+        self.errors = []
+        self.months = Counter()
+        self.seconds = 0.0
+
+    def add_error(self, line_no: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_no}: {message}")
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.imported / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        lines = [f"Imported {self.imported:,} row(s) in {self.seconds:.2f}s "
+                 f"({self.rows_per_second:,.0f} rows/s)."]
+        if self.months:
+            lines.append("By month: " + ", ".join(
+                f"{month} {count:,}" for month, count in self.months.items()))
+        if self.duplicates:
+            lines.append(f"Skipped {self.duplicates:,} row(s) imported before.")
+        if self.uncategorised:
+            lines.append(f"{self.uncategorised:,} row(s) left without a category.")
+        if self.error_count:
+            lines.append(f"{self.error_count:,} line(s) could not be read:")
+            lines.extend(self.errors)
+            if self.error_count > len(self.errors):
+                lines.append("…")
+        return "\n".join(lines)
+
+
+async def import_expenses(lines, ledger: Ledger, user_id, source: str,
+                          chunk: int = IMPORT_CHUNK, classifier=None) -> ImportReport:
+    """
+    Stream CSV `lines` into the ledger.
+
+    Rows are parsed lazily and committed `chunk` at a time, so memory stays
+    bounded whatever the file size; the event loop gets a turn between
+    chunks. Rows without a category column get the category the user last
+    gave the same product or, failing that, the classifier's confident
+    guess. The classifier then learns the categories of the new rows.
+
+    Args:
+        lines: Iterable of CSV lines (an open file or a list of strings).
+        ledger (Ledger): Ledger to commit to.
+        user_id: Telegram user the expenses belong to.
+        source (str): Stable identifier of the input (e.g. the file's unique
+            ID), so importing it twice does not duplicate rows.
+        chunk (int): Rows per ledger transaction.
+        classifier (CategoryClassifier): Optional; suggests missing categories
+            and learns from the imported rows.
+
+    Returns:
+        ImportReport: What was imported and which lines were rejected.
+    """
+    report = ImportReport()
+    known = {}
+    batch = []
+    started = time.perf_counter()
+    if classifier is not None:
+        # Load the user's index before any rows land in the ledger, so a
+        # first-time build does not count them twice.
+        classifier.index(user_id)
+
+    def suggest(product: str) -> str:
+        category = ledger.last_category(user_id, product)
+        if not category and classifier is not None:
+            guess, confident = classifier.suggest(user_id, product)
+            category = guess if confident else ""
+        return category
+
+    def commit():
+        # Rows imported before are skipped, and must not be learned again.
+        existing = ledger.existing_ids([e.id for e in batch])
+        new = [e for e in batch if e.id not in existing]
+        inserted = ledger.add_many(new)
+        if classifier is not None:
+            classifier.learn(user_id, new)
+        report.imported += inserted
+        report.duplicates += len(batch) - inserted
+        batch.clear()
+
+    for line_no, columns, fields in read_rows(lines):
+        try:
+            expenditure = parse_row(columns, fields, user_id)
+        except ValueError as e:
+            report.add_error(line_no, str(e))
+            continue
+
+        if not expenditure.category:
+            key = expenditure.product.lower()
+            if key not in known:
+                if len(known) >= MAX_KNOWN_PRODUCTS:
+                    known.clear()
+                known[key] = suggest(expenditure.product)
+            expenditure.category = known[key]
+        if expenditure.category:
+            expenditure.set_spend_type()
+        else:
+            report.uncategorised += 1
+
+        expenditure.id = uuid.uuid5(IMPORT_ID_NAMESPACE, f"{user_id}:{source}:{line_no}").hex
+        report.months[find_month(expenditure.date)] += 1
+        batch.append(expenditure)
+        if len(batch) >= chunk:
+            commit()
+            await asyncio.sleep(0)
+
+    if batch:
+        commit()
+    report.seconds = time.perf_counter() - started
+    logger.info("Imported %d row(s) for user %s in %.2fs",
+                report.imported, user_id, report.seconds)
+    return report
@@ -0,0 +1,215 @@
+"""
+Spending insights computed locally from raw expense rows.
+
+Rows are the `A:E` cells of a month tab (see utils.HEADERS). They are turned
+into NumPy columns once, after which every breakdown is a vectorised
+reduction, so any date window can be summarised without sheet formulas.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+from utils import CATEGORIES, CATEGORY_TO_SPEND_TYPE_DEFAULT, find_date, parse_amount, parse_date
+
+# Google Sheets serial dates count days from 1899-12-30.
+SHEETS_EPOCH = np.datetime64("1899-12-30", "D")
+SPEND_TYPES = {
+    "recurring": "Recurring",
+    "essential": "Essential",
+    "discretionary": "Discretionary",
+    "one_off": "One-off",
+}
+# Spend types counted as day-to-day spending for the weekday/weekend averages.
+DAY_TO_DAY = ("Essential", "Discretionary")
+INCOME = "Income"
+
+_CATEGORY_CODES = {c: i for i, c in enumerate(CATEGORIES)}
+_SPEND_TYPE_NAMES = sorted(set(CATEGORY_TO_SPEND_TYPE_DEFAULT.values()))
+_SPEND_TYPE_CODES = {s: i for i, s in enumerate(_SPEND_TYPE_NAMES)}
+_UNKNOWN = -1
+
+
+def _parse_date(value) -> np.datetime64:
+    try:
+        return np.datetime64(parse_date(str(value)), "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+def _parse_amount(value) -> float:
+    try:
+        return parse_amount(value)
+    except ValueError:
+        return 0.0
+
+
+def to_columns(rows) -> dict:
+    """
+    Convert raw `A:E` rows into NumPy columns.
+
+    Args:
+        rows (list): Rows of [Date, Product, Price, Category, Spend Type], as
+            returned by values().get with UNFORMATTED_VALUE. A leading header
+            row and blank rows are skipped.
+
+    Returns:
+        dict: `dates` (datetime64[D]), `amounts` (float64), `categories` and
+        `spend_types` (int codes, -1 when unknown).
+    """
+    rows = [r for r in rows if r and r[0] not in ("", None, "Date")]
+    n = len(rows)
+
+    def cell(row, i):
+        return row[i] if len(row) > i else ""
+
+    # Dates normally arrive as serial numbers and convert in one step; any
+    # cell the sheet kept as text is parsed individually.
+    serials = np.fromiter(
+        (r[0] if isinstance(r[0], (int, float)) else np.nan for r in rows),
+        dtype=np.float64, count=n)
+    numeric = ~np.isnan(serials)
+    dates = np.full(n, np.datetime64("NaT"), dtype="datetime64[D]")
+    dates[numeric] = SHEETS_EPOCH + serials[numeric].astype(np.int64)
+    for i in np.flatnonzero(~numeric):
+        dates[i] = _parse_date(rows[i][0])
+
+    spend_type_of = CATEGORY_TO_SPEND_TYPE_DEFAULT.get
+    return {
+        "dates": dates,
+        "amounts": np.fromiter((_parse_amount(cell(r, 2)) for r in rows),
+                               dtype=np.float64, count=n),
+        "categories": np.fromiter(
+            (_CATEGORY_CODES.get(cell(r, 3), _UNKNOWN) for r in rows),
+            dtype=np.int16, count=n),
+        "spend_types": np.fromiter(
+            (_SPEND_TYPE_CODES.get(cell(r, 4) or spend_type_of(cell(r, 3), ""), _UNKNOWN)
+             for r in rows),
+            dtype=np.int16, count=n),
+    }
+
+
+def month_range(first: date) -> tuple:
+    """Return (first day, last day) of the month starting on `first`."""
+    end = (date(first.year + (first.month == 12), first.month % 12 + 1, 1)
+           - timedelta(days=1))
+    return first, end
+
+
+def format_amount(value: float) -> str:
+    return f"-${-value:,.2f}" if value < 0 else f"${value:,.2f}"
+
+
+class Totals:
+    """
+    Additive sums behind the insights of a date window.
+
+    Totals of disjoint windows (e.g. months) add up to the totals of their
+    union, so multi-month insights merge per-month totals instead of rows.
+    """
+
+    def __init__(self):
+        self.by_category = np.zeros(len(CATEGORIES))
+        self.by_spend_type = np.zeros(len(_SPEND_TYPE_NAMES))
+        self.total = 0.0
+        self.weekday_spend = 0.0
+        self.weekend_spend = 0.0
+
+    def __iadd__(self, other: "Totals") -> "Totals":
+        self.by_category += other.by_category
+        self.by_spend_type += other.by_spend_type
+        self.total += other.total
+        self.weekday_spend += other.weekday_spend
+        self.weekend_spend += other.weekend_spend
+        return self
+
+
+def totals_from_columns(columns: dict, start: date, end: date) -> Totals:
+    """Sum the expenses of `columns` (see to_columns) dated within [start, end]."""
+    dates = columns["dates"]
+    mask = (dates >= np.datetime64(start, "D")) & (dates <= np.datetime64(end, "D"))
+
+    amounts = columns["amounts"][mask]
+    categories = columns["categories"][mask]
+    spend_types = columns["spend_types"][mask]
+    days = dates[mask]
+
+    totals = Totals()
+    known = categories >= 0
+    totals.by_category = np.bincount(categories[known], weights=amounts[known],
+                                     minlength=len(CATEGORIES))
+    known = spend_types >= 0
+    totals.by_spend_type = np.bincount(spend_types[known], weights=amounts[known],
+                                       minlength=len(_SPEND_TYPE_NAMES))
+
+    expense = categories != _CATEGORY_CODES[INCOME]
+    totals.total = amounts[expense].sum()
+
+    day_to_day = np.isin(spend_types,
+                         [_SPEND_TYPE_CODES[s] for s in DAY_TO_DAY])
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 numbers Monday as 0.
+    weekday_no = (days.astype(np.int64) + 3) % 7
+    weekend = weekday_no >= 5
+    totals.weekday_spend = amounts[day_to_day & ~weekend].sum()
+    totals.weekend_spend = amounts[day_to_day & weekend].sum()
+    return totals
+
+
+def totals_from_aggregates(rows) -> Totals:
+    """Sum a month's running totals (see Ledger.totals) instead of its rows."""
+    totals = Totals()
+    for category, spend_type, weekday, amount, _ in rows:
+        spend_type = spend_type or CATEGORY_TO_SPEND_TYPE_DEFAULT.get(category, "")
+        if category in _CATEGORY_CODES:
+            totals.by_category[_CATEGORY_CODES[category]] += amount
+        if spend_type in _SPEND_TYPE_CODES:
+            totals.by_spend_type[_SPEND_TYPE_CODES[spend_type]] += amount
+        if category != INCOME:
+            totals.total += amount
+        if spend_type in DAY_TO_DAY:
+            if weekday >= 5:
+                totals.weekend_spend += amount
+            else:
+                totals.weekday_spend += amount
+    return totals
+
+
+def summarise(totals: Totals, start: date, end: date,
+              today: str | None = None) -> dict:
+    """
+    Turn the totals of [start, end] into insights.
+
+    Averages are day-to-day spending per weekday (or weekend day) in the
+    window, counting only days up to today.
+
+    Returns:
+        dict: Same shape as consumed by utils.format_insights_message.
+    """
+    lo = np.datetime64(start, "D")
+    hi = np.datetime64(end, "D")
+    last = min(hi, np.datetime64(today or find_date(), "D"))
+    n_days = max(int((last - lo).astype(np.int64)) + 1, 0)
+    n_weekdays = int(np.busday_count(lo, last + 1)) if n_days else 0
+    n_weekend = n_days - n_weekdays
+
+    avg_weekday = totals.weekday_spend / n_weekdays if n_weekdays else 0.0
+    avg_weekend = totals.weekend_spend / n_weekend if n_weekend else 0.0
+    pct_diff = (f"{(avg_weekend - avg_weekday) / avg_weekday:.2%}"
+                if avg_weekday else "N/A")
+
+    return {
+        "category_breakdown": {
+            category: format_amount(totals.by_category[i])
+            for i, category in enumerate(CATEGORIES)
+        },
+        "averages": {
+            "weekday": format_amount(avg_weekday),
+            "weekend": format_amount(avg_weekend),
+            "percentage_diff": pct_diff,
+        },
+        "spend_types": {
+            key: format_amount(totals.by_spend_type[_SPEND_TYPE_CODES[name]])
+            for key, name in SPEND_TYPES.items()
+        },
+        "total": format_amount(totals.total),
+    }
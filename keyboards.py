@@ -0,0 +1,29 @@
+import re
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils import CATEGORIES, chunk_list
+
+
+# Callback data of the category buttons, for CallbackQueryHandler(pattern=...).
+CATEGORY_PATTERN = re.compile(rf"^(?:{'|'.join(map(re.escape, CATEGORIES))})$")
+
+
+def _category_rows() -> list:
+    return [[InlineKeyboardButton(cat, callback_data=cat) for cat in row]
+            for row in chunk_list(CATEGORIES, 3)]
+
+
+# Keyboards are immutable, so they are built once and shared by every message.
+CATEGORY_KEYBOARD = InlineKeyboardMarkup(_category_rows())
+# One variant per category with that category offered on a row of its own on top.
+_SUGGESTED_KEYBOARDS = {
+    cat: InlineKeyboardMarkup([[InlineKeyboardButton(f"✅ {cat}", callback_data=cat)],
+                               *_category_rows()])
+    for cat in CATEGORIES
+}
+
+
+def category_keyboard(suggested: str = "") -> InlineKeyboardMarkup:
+    """The categories keyboard, optionally with `suggested` offered first."""
+    return _SUGGESTED_KEYBOARDS.get(suggested, CATEGORY_KEYBOARD)
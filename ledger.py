@@ -0,0 +1,279 @@
+import os
+import time
+import uuid
+import random
+import sqlite3
+import logging
+
+from expenditure import Expenditure
+from utils import find_month
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv("LEDGER_PATH", "cashbotic.db")
+SYNC_BACKOFF_BASE = float(os.getenv("SYNC_BACKOFF_BASE", "2"))
+SYNC_BACKOFF_MAX = float(os.getenv("SYNC_BACKOFF_MAX", "300"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id              TEXT PRIMARY KEY,
+    user_id         INTEGER,
+    date            TEXT NOT NULL,
+    product         TEXT NOT NULL,
+    amount          REAL NOT NULL,
+    category        TEXT NOT NULL DEFAULT '',
+    spend_type      TEXT NOT NULL DEFAULT '',
+    month_tab       TEXT NOT NULL,
+    created_at      REAL NOT NULL,
+    synced_at       REAL,
+    sync_attempts   INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_product
+    ON expenses (user_id, product COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_expenses_unsynced
+    ON expenses (next_attempt_at) WHERE synced_at IS NULL;
+"""
+
+# Running totals per user, month (yyyy-mm), category, spend type and weekday
+# (Monday = 0). Triggers keep them in step with `expenses` inside the same
+# transaction, so every insert path updates them at O(1) cost per row.
+AGGREGATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aggregates (
+    user_id     INTEGER NOT NULL,
+    month       TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    spend_type  TEXT NOT NULL,
+    weekday     INTEGER NOT NULL,
+    amount      REAL NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, category, spend_type, weekday)
+);
+CREATE TRIGGER IF NOT EXISTS expenses_aggregate_insert AFTER INSERT ON expenses
+BEGIN
+    INSERT INTO aggregates VALUES (
+        COALESCE(NEW.user_id, 0), substr(NEW.date, 1, 7), NEW.category,
+        NEW.spend_type, (CAST(strftime('%w', NEW.date) AS INTEGER) + 6) % 7,
+        NEW.amount, 1)
+    ON CONFLICT (user_id, month, category, spend_type, weekday) DO UPDATE
+    SET amount = amount + excluded.amount, count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_aggregate_delete AFTER DELETE ON expenses
+BEGIN
+    UPDATE aggregates SET amount = amount - OLD.amount, count = count - 1
+    WHERE user_id = COALESCE(OLD.user_id, 0) AND month = substr(OLD.date, 1, 7)
+      AND category = OLD.category AND spend_type = OLD.spend_type
+      AND weekday = (CAST(strftime('%w', OLD.date) AS INTEGER) + 6) % 7;
+    DELETE FROM aggregates WHERE count <= 0;
+END;
+"""
+_RECOMPUTE = ("SELECT COALESCE(user_id, 0), substr(date, 1, 7), category, spend_type, "
+              "(CAST(strftime('%w', date) AS INTEGER) + 6) % 7, SUM(amount), COUNT(*) "
+              "FROM expenses GROUP BY 1, 2, 3, 4, 5")
+
+_INSERT = ("INSERT OR IGNORE INTO expenses (id, user_id, date, product, "
+           "amount, category, spend_type, month_tab, created_at) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+_COLUMNS = ("id, user_id, date, product, amount, category, spend_type, "
+            "month_tab, sync_attempts")
+
+
+class Ledger:
+    """
+    Local SQLite store of every expense, the source of truth for the bot.
+
+    Expenses are committed here first and replicated to Google Sheets later
+    by the syncer, which tracks progress through `synced_at`.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL keeps commits durable across app crashes without an
+        # fsync per write.
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        new_aggregates = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'aggregates'").fetchone() is None
+        self.conn.executescript(AGGREGATES_SCHEMA)
+        if new_aggregates:
+            # Ledger from before the aggregates existed: backfill them once.
+            self.rebuild_aggregates()
+
+    def add(self, expenditure: Expenditure) -> bool:
+        """
+        Commit an expenditure, assigning it a row ID if it has none.
+
+        The row ID is the idempotency key: adding an expenditure whose ID is
+        already stored is a no-op.
+
+        Returns:
+            bool: False if the row was already stored.
+        """
+        with self.conn:
+            cursor = self.conn.execute(_INSERT, self._params(expenditure, time.time()))
+        return cursor.rowcount == 1
+
+    def add_many(self, expenditures) -> int:
+        """
+        Commit a batch of expenditures in one transaction, like `add`.
+
+        Returns:
+            int: Number of rows that were not already stored.
+        """
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                _INSERT, (self._params(e, now) for e in expenditures))
+        return cursor.rowcount
+
+    @staticmethod
+    def _params(expenditure: Expenditure, now: float) -> tuple:
+        if not expenditure.id:
+            expenditure.id = uuid.uuid4().hex
+        return (expenditure.id, expenditure.user_id, expenditure.date,
+                expenditure.product, expenditure.amount, expenditure.category,
+                expenditure.spend_type, find_month(expenditure.date), now)
+
+    def existing_ids(self, ids: list[str], chunk: int = 500) -> set[str]:
+        """The IDs among `ids` that are already stored."""
+        found = set()
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT id FROM expenses WHERE id IN ({','.join('?' * len(part))})", part))
+        return found
+
+    def last_category(self, user_id, product: str) -> str:
+        """Category the user most recently gave `product`, or ""."""
+        row = self.conn.execute(
+            "SELECT category FROM expenses WHERE user_id = ? "
+            "AND product = ? COLLATE NOCASE AND category != '' "
+            "ORDER BY created_at DESC LIMIT 1",
+            (user_id, product.strip()),
+        ).fetchone()
+        return row[0] if row else ""
+
+    def unsynced(self, limit: int = 500) -> list[sqlite3.Row]:
+        """Return up to `limit` unsynced rows that are due for an attempt."""
+        return self.conn.execute(
+            f"SELECT {_COLUMNS} FROM expenses "
+            "WHERE synced_at IS NULL AND next_attempt_at <= ? "
+            "ORDER BY created_at LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+
+    def mark_synced(self, ids: list[str]) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE expenses SET synced_at = ? WHERE id = ?",
+                [(now, i) for i in ids])
+
+    def mark_attempted(self, ids: list[str]) -> None:
+        """
+        Count a sync attempt before it is made, so that if it lands but the
+        process dies before `mark_synced`, the next attempt checks the tab
+        for the rows first.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE expenses SET sync_attempts = sync_attempts + 1 WHERE id = ?",
+                [(i,) for i in ids])
+
+    def mark_failed(self, ids: list[str]) -> None:
+        """Schedule another attempt with exponential backoff and jitter."""
+        now = time.time()
+        with self.conn:
+            for i in ids:
+                (attempts,) = self.conn.execute(
+                    "SELECT sync_attempts FROM expenses WHERE id = ?", (i,)
+                ).fetchone()
+                # Already counted by mark_attempted.
+                delay = min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+                self.conn.execute(
+                    "UPDATE expenses SET next_attempt_at = ? WHERE id = ?",
+                    (now + delay * random.uniform(0.5, 1.5), i))
+
+    def sync_lag(self) -> dict:
+        """Number of unsynced rows and age in seconds of the oldest one."""
+        count, oldest = self.conn.execute(
+            "SELECT COUNT(*), MIN(created_at) FROM expenses WHERE synced_at IS NULL"
+        ).fetchone()
+        return {
+            "unsynced": count,
+            "lag_seconds": time.time() - oldest if oldest else 0.0,
+        }
+
+    def totals(self, user_id, month: str) -> list[sqlite3.Row]:
+        """
+        Running totals of a user's month.
+
+        Args:
+            user_id: Telegram user ID.
+            month (str): Month as yyyy-mm.
+
+        Returns:
+            list: Rows of category, spend_type, weekday, amount and count.
+        """
+        return self.conn.execute(
+            "SELECT category, spend_type, weekday, amount, count FROM aggregates "
+            "WHERE user_id = ? AND month = ?", (user_id, month)).fetchall()
+
+    def first_recorded(self, user_id) -> float | None:
+        """When the user's first expense was committed (epoch seconds), if any."""
+        return self.conn.execute(
+            "SELECT MIN(created_at) FROM expenses WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def rebuild_aggregates(self) -> None:
+        """Recompute every running total from the expense rows."""
+        with self.conn:
+            self.conn.execute("DELETE FROM aggregates")
+            self.conn.execute(f"INSERT INTO aggregates {_RECOMPUTE}")
+        logger.info("Rebuilt ledger aggregates")
+
+    def verify_aggregates(self, tolerance: float = 0.005) -> list[tuple]:
+        """
+        Compare the running totals against a full recompute.
+
+        Returns:
+            list: (key, stored (amount, count), recomputed (amount, count))
+            for every total that differs; empty when they all match.
+        """
+        def by_key(rows):
+            return {tuple(r[:5]): (r[5], r[6]) for r in rows}
+
+        stored = by_key(self.conn.execute(
+            "SELECT user_id, month, category, spend_type, weekday, amount, count "
+            "FROM aggregates").fetchall())
+        expected = by_key(self.conn.execute(_RECOMPUTE).fetchall())
+        mismatches = []
+        for key in stored.keys() | expected.keys():
+            got = stored.get(key, (0.0, 0))
+            want = expected.get(key, (0.0, 0))
+            if got[1] != want[1] or abs(got[0] - want[0]) > tolerance:
+                mismatches.append((key, got, want))
+        return mismatches
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python ledger.py verify|rebuild
+    ledger = Ledger()
+    if sys.argv[1:] == ["rebuild"]:
+        ledger.rebuild_aggregates()
+    mismatches = ledger.verify_aggregates()
+    for key, got, want in mismatches:
+        print(f"{key}: stored {got}, recomputed {want}")
+    print(f"{len(mismatches)} mismatched aggregate(s)")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,142 @@
+"""
+Process-wide logging setup, applied once at startup by `configure_logging`.
+
+Records are put on an in-memory queue by the calling code and written to
+stdout by a background thread, so a slow log sink never blocks the event
+loop. Levels are set per logger from the environment, repeated low-level
+messages are sampled, and secrets such as the bot token are redacted from
+everything that is written.
+"""
+
+import os
+import re
+import sys
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Comma-separated logger=LEVEL pairs, applied over DEFAULT_LEVELS.
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# A message template logged more than LOG_SAMPLE_BURST times within
+# LOG_SAMPLE_WINDOW seconds is then only kept once every LOG_SAMPLE_EVERY
+# times until the window ends. Warnings and errors are never sampled.
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# HTTP clients log every request (with the bot token in Telegram URLs) and
+# the discovery client logs every Sheets URL.
+DEFAULT_LEVELS = {
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "googleapiclient": "WARNING",
+    "google_auth_httplib2": "WARNING",
+    "telegram": "INFO",
+}
+# Bot API tokens, e.g. in ".../bot123456:AA.../sendMessage". Not \b: there is
+# no word boundary between "bot" and the token's digits.
+_TOKEN_RE = re.compile(r"(?<!\d)\d{5,}:[A-Za-z0-9_-]{30,}(?![A-Za-z0-9_-])")
+REDACTED = "[REDACTED]"
+# Environment variables whose values are never written to the log.
+SECRET_ENV = ("TOKEN", "WEBHOOK_SECRET", "GOOGLE_TOKEN_PICKLE_B64", "REDIS_URL")
+
+_listener = None
+
+
+def parse_levels(text: str) -> dict:
+    """'httpx=INFO, telegram.ext=DEBUG' -> {'httpx': 'INFO', 'telegram.ext': 'DEBUG'}"""
+    levels = {}
+    for pair in text.split(","):
+        if pair.strip():
+            name, _, level = pair.partition("=")
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class SamplingFilter(logging.Filter):
+    """Thin out bursts of the same INFO/DEBUG message template."""
+
+    MAX_TEMPLATES = 1000
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW,
+                 every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.every = every
+        self._seen = {}  # (logger, template) -> [window start, count]
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is None or now - seen[0] > self.window:
+            if len(self._seen) >= self.MAX_TEMPLATES:
+                self._seen.clear()
+            self._seen[key] = [now, 1]
+            return True
+        seen[1] += 1
+        if seen[1] <= self.burst or (seen[1] - self.burst) % self.every == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+class RedactingFormatter(logging.Formatter):
+    """Formatter masking known secrets and anything shaped like a bot token."""
+
+    def __init__(self, fmt: str = FORMAT, secrets=()):
+        super().__init__(fmt)
+        self.secrets = [s for s in secrets if s and len(s) >= 8]
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = _TOKEN_RE.sub(REDACTED, super().format(record))
+        for secret in self.secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+
+def configure_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS) -> None:
+    """
+    Route all logging through a queue to stdout; safe to call more than once.
+
+    Args:
+        level (str): Level of the root logger.
+        levels (str): Per-logger overrides as comma-separated logger=LEVEL pairs.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(RedactingFormatter(secrets=[os.getenv(name) for name in SECRET_ENV]))
+    log_queue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, logger_level in {**DEFAULT_LEVELS, **parse_levels(levels)}.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
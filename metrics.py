@@ -0,0 +1,177 @@
+"""
+Latency histograms and counters, rendered in the Prometheus text format.
+
+Code paths are timed with `span(name)` (or `timed(histogram, *labels)` for a
+dedicated histogram). With METRICS_ENABLED=0 both return a shared no-op
+context manager and counters ignore increments, so instrumentation costs a
+flag check.
+"""
+
+import os
+import time
+import logging
+from bisect import bisect_left
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        if METRICS_ENABLED:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value: float, *labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self._read = read
+
+    def samples(self):
+        try:
+            yield f"{self.name} {float(self._read())}"
+        except Exception:
+            logger.warning("Could not read gauge %s", self.name, exc_info=True)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labelnames: tuple = ()) -> Counter:
+    return registry.register(Counter(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames: tuple = (),
+              buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge(name: str, help: str, read) -> Gauge:
+    return registry.register(Gauge(name, help, read))
+
+
+class _Span:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.histogram.observe(elapsed, *self.labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span %s %s took %.2fms", self.histogram.name,
+                         dict(zip(self.histogram.labelnames, self.labels)),
+                         elapsed * 1000)
+        return False
+
+
+SPAN_SECONDS = histogram("cashbotic_span_seconds",
+                         "Duration of instrumented code paths.", ("span",))
+
+
+def timed(histogram: Histogram, *labels):
+    """Context manager observing the duration of its block into `histogram`."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(histogram, labels)
+
+
+def span(name: str):
+    """Time a block under cashbotic_span_seconds{span=name}."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(SPAN_SECONDS, (name,))
@@ -0,0 +1,199 @@
+import os
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from expenditure import Expenditure
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+REDIS_URL = os.getenv("REDIS_URL")
+# Last written value kept per entry to skip unchanged writes; entries beyond
+# this many are forgotten least recently used first, costing one rewrite.
+PERSISTENCE_CACHE_ENTRIES = int(os.getenv("PERSISTENCE_CACHE_ENTRIES", "10000"))
+
+
+class SQLiteKV:
+    """
+    The subset of the Redis hash API the persistence needs, backed by SQLite.
+
+    A `redis.Redis` client offers the same `hgetall`/`hset`/`hdel` calls, so
+    either can be handed to KVPersistence.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv ("
+                         "name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                         "PRIMARY KEY (name, key))")
+
+    def hgetall(self, name: str) -> dict:
+        return dict(self.conn.execute(
+            "SELECT key, value FROM kv WHERE name = ?", (name,)).fetchall())
+
+    def hset(self, name: str, key: str, value: str) -> None:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)",
+                              (name, key, value))
+
+    def hdel(self, name: str, key: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM kv WHERE name = ? AND key = ?",
+                              (name, key))
+
+
+def _encode(obj):
+    if isinstance(obj, Expenditure):
+        return {"__expenditure__": [obj.product, obj.amount, obj.date, obj.category,
+                                    obj.spend_type, obj.id, obj.user_id]}
+    raise TypeError(f"Cannot persist {type(obj).__name__}")
+
+
+def _decode(obj):
+    fields = obj.get("__expenditure__")
+    if fields is None:
+        return obj
+    product, amount, date, category, spend_type, id_, user_id = fields
+    expenditure = Expenditure(product, amount, date, category, user_id=user_id)
+    expenditure.spend_type = spend_type
+    expenditure.id = id_
+    return expenditure
+
+
+def dumps(data) -> str:
+    return json.dumps(data, default=_encode, separators=(",", ":"))
+
+
+def loads(text):
+    if isinstance(text, bytes):
+        text = text.decode()
+    return json.loads(text, object_hook=_decode)
+
+
+class KVPersistence(BasePersistence):
+    """
+    Stores conversation states and user_data in a key-value backend.
+
+    The application hands over changes every `update_interval` seconds, only
+    for entries touched since the last run; on top of that an entry is only
+    written when its serialised form actually changed.
+    """
+
+    def __init__(self, kv, update_interval: float = PERSISTENCE_INTERVAL,
+                 cache_entries: int = PERSISTENCE_CACHE_ENTRIES):
+        """
+        Args:
+            kv: SQLiteKV, redis.Redis or anything with hgetall/hset/hdel.
+            update_interval (float): Seconds between persistence runs.
+            cache_entries (int): Entries whose last written value is kept.
+        """
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                        user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.kv = kv
+        self.cache_entries = cache_entries
+        self._written = OrderedDict()
+        self.writes = 0
+        self.skipped_writes = 0
+
+    def _remember(self, name: str, key: str, value: str) -> None:
+        self._written[(name, key)] = value
+        self._written.move_to_end((name, key))
+        if len(self._written) > self.cache_entries:
+            self._written.popitem(last=False)
+
+    def _put(self, name: str, key: str, value: str) -> None:
+        if self._written.get((name, key)) == value:
+            self._written.move_to_end((name, key))
+            self.skipped_writes += 1
+            return
+        self.kv.hset(name, key, value)
+        self._remember(name, key, value)
+        self.writes += 1
+
+    def _delete(self, name: str, key: str) -> None:
+        self.kv.hdel(name, key)
+        self._written.pop((name, key), None)
+
+    def _load(self, name: str) -> dict:
+        items = {}
+        for key, value in self.kv.hgetall(name).items():
+            key = key.decode() if isinstance(key, bytes) else key
+            value = value.decode() if isinstance(value, bytes) else value
+            self._remember(name, key, value)
+            items[key] = loads(value)
+        return items
+
+    async def get_user_data(self) -> dict:
+        return {int(k): v for k, v in self._load("user_data").items()}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {tuple(json.loads(k)): v
+                for k, v in self._load(f"conversation:{name}").items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        field = json.dumps(list(key), separators=(",", ":"))
+        if new_state is None:
+            self._delete(f"conversation:{name}", field)
+        else:
+            self._put(f"conversation:{name}", field, dumps(new_state))
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        if data:
+            self._put("user_data", str(user_id), dumps(data))
+        else:
+            self._delete("user_data", str(user_id))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._delete("user_data", str(user_id))
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+
+def build_persistence(conn: sqlite3.Connection) -> KVPersistence:
+    """Use Redis when REDIS_URL is set, otherwise the given SQLite database."""
+    if REDIS_URL:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("REDIS_URL is set but the redis package is not installed") from e
+        return KVPersistence(redis.Redis.from_url(REDIS_URL))
+    return KVPersistence(SQLiteKV(conn))
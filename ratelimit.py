@@ -0,0 +1,37 @@
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` tokens per second, holding at most `capacity`.
+
+    Short bursts up to `capacity` pass immediately; beyond that callers are
+    smoothed to the configured rate. Waiting is left to the caller (see
+    sheets_client.Scheduler, which serves waiters by priority and counts
+    them in `waits`).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waits = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        """Seconds until the next token becomes available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
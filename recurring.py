@@ -0,0 +1,289 @@
+"""
+Recurring expenses: rules such as "Netflix 15.98 Subscriptions monthly 5"
+and the background task recording them in the ledger when they fall due.
+
+Each occurrence gets an ID derived from its rule and date, so recording the
+same occurrence twice (e.g. after a crash between saving the expenses and
+advancing the rule) is a no-op in the ledger.
+"""
+
+import os
+import uuid
+import asyncio
+import calendar
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from expenditure import Expenditure
+from ledger import Ledger
+from utils import CATEGORIES, find_category, find_date
+
+logger = logging.getLogger(__name__)
+
+RECURRING_INTERVAL = float(os.getenv("RECURRING_INTERVAL", "3600"))
+RECURRING_BATCH = int(os.getenv("RECURRING_BATCH", "500"))
+# Occurrences of one rule recorded in a single catch-up, e.g. a daily rule
+# after a long outage.
+RECURRING_MAX_CATCH_UP = int(os.getenv("RECURRING_MAX_CATCH_UP", "366"))
+RECURRING_ID_NAMESPACE = uuid.UUID("0c1f8e52-7a0b-4f4e-b0d3-6a3f2e9c5d71")
+
+_UNITS = {"day": 1, "days": 1, "week": 7, "weeks": 7}
+
+
+def parse_schedule(words: list[str]) -> tuple[int | None, int | None]:
+    """
+    Parse 'monthly <day>', 'weekly', 'daily' or 'every <n> days|weeks'.
+
+    Returns:
+        tuple: (day of the month, None) or (None, interval in days).
+
+    Raises:
+        ValueError: If the schedule is not understood.
+    """
+    words = [w.lower() for w in words]
+    if len(words) == 2 and words[0] == "monthly" and words[1].isdigit():
+        day = int(words[1])
+        if 1 <= day <= 31:
+            return day, None
+        raise ValueError("the day of the month must be between 1 and 31")
+    if words == ["weekly"]:
+        return None, 7
+    if words == ["daily"]:
+        return None, 1
+    if len(words) == 3 and words[0] == "every" and words[1].isdigit() and words[2] in _UNITS:
+        days = int(words[1]) * _UNITS[words[2]]
+        if days >= 1:
+            return None, days
+    raise ValueError(f"unknown schedule {' '.join(words)!r}")
+
+
+def describe_schedule(day: int | None, interval_days: int | None) -> str:
+    if day:
+        return f"monthly on day {day}"
+    if interval_days == 1:
+        return "daily"
+    if interval_days % 7 == 0:
+        weeks = interval_days // 7
+        return "weekly" if weeks == 1 else f"every {weeks} weeks"
+    return f"every {interval_days} days"
+
+
+def _on_day(year: int, month: int, day: int) -> date:
+    """`day` of the month, or its last day for short months."""
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(after: date, day: int | None, interval_days: int | None) -> date:
+    """The occurrence following `after`."""
+    if interval_days:
+        return after + timedelta(days=interval_days)
+    year, month = (after.year, after.month + 1) if after.month < 12 else (after.year + 1, 1)
+    return _on_day(year, month, day)
+
+
+def first_occurrence(today: date, day: int | None, interval_days: int | None) -> date:
+    """First occurrence of a new rule: today or later, never in the past."""
+    if interval_days:
+        return today
+    this_month = _on_day(today.year, today.month, day)
+    return this_month if this_month >= today else next_occurrence(this_month, day, None)
+
+
+class RecurringExpenses:
+    """Per-user recurring expense rules stored next to the ledger."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        """
+        Args:
+            conn: The ledger's sqlite3 connection.
+        """
+        self.conn = conn
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS recurring_rules ("
+                         "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                         "product TEXT NOT NULL, amount REAL NOT NULL, "
+                         "category TEXT NOT NULL, day INTEGER, interval_days INTEGER, "
+                         "next_run TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_next_run "
+                         "ON recurring_rules (next_run)")
+
+    def add(self, user_id, product: str, amount: float, category: str,
+            schedule: list[str], today: str | None = None) -> sqlite3.Row:
+        """
+        Register a rule; its first occurrence is today at the earliest.
+
+        Raises:
+            ValueError: If the category or schedule is not understood.
+        """
+        category = find_category(category)
+        if category is None:
+            raise ValueError(f"unknown category, choose one of {', '.join(CATEGORIES)}")
+        day, interval_days = parse_schedule(schedule)
+        first = first_occurrence(date.fromisoformat(today or find_date()), day, interval_days)
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO recurring_rules (user_id, product, amount, category, "
+                "day, interval_days, next_run) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, product, amount, category, day, interval_days, first.isoformat()))
+        return self.get(user_id, cursor.lastrowid)
+
+    def get(self, user_id, rule_id: int) -> sqlite3.Row | None:
+        return self.conn.execute(
+            "SELECT * FROM recurring_rules WHERE user_id = ? AND id = ?",
+            (user_id, rule_id)).fetchone()
+
+    def rules(self, user_id) -> list[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM recurring_rules WHERE user_id = ? ORDER BY next_run, id",
+            (user_id,)).fetchall()
+
+    def remove(self, user_id, rule_id: int) -> bool:
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM recurring_rules WHERE user_id = ? AND id = ?", (user_id, rule_id))
+        return cursor.rowcount > 0
+
+    def due(self, today: str, limit: int = RECURRING_BATCH) -> tuple[list[Expenditure], list]:
+        """
+        Occurrences due up to `today` of the rules that are next in line.
+
+        Missed occurrences are all included, up to RECURRING_MAX_CATCH_UP per
+        rule. Nothing is changed until `advance` is called.
+
+        Returns:
+            tuple: The expenses, and (rule ID, next run) pairs for `advance`.
+        """
+        end = date.fromisoformat(today)
+        expenses, next_runs = [], []
+        for rule in self.conn.execute(
+                "SELECT * FROM recurring_rules WHERE next_run <= ? ORDER BY next_run LIMIT ?",
+                (today, limit)):
+            run = date.fromisoformat(rule["next_run"])
+            occurrences = 0
+            while run <= end and occurrences < RECURRING_MAX_CATCH_UP:
+                expenditure = Expenditure(rule["product"], rule["amount"], run.isoformat(),
+                                          rule["category"], rule["user_id"])
+                expenditure.set_spend_type()
+                expenditure.id = uuid.uuid5(RECURRING_ID_NAMESPACE,
+                                            f"{rule['id']}:{run.isoformat()}").hex
+                expenses.append(expenditure)
+                occurrences += 1
+                run = next_occurrence(run, rule["day"], rule["interval_days"])
+            if occurrences == RECURRING_MAX_CATCH_UP and run <= end:
+                logger.warning("Recurring rule %s: skipping missed occurrences up to %s",
+                               rule["id"], today)
+                while run <= end:
+                    run = next_occurrence(run, rule["day"], rule["interval_days"])
+            next_runs.append((rule["id"], run.isoformat()))
+        return expenses, next_runs
+
+    def advance(self, next_runs: list) -> None:
+        with self.conn:
+            self.conn.executemany("UPDATE recurring_rules SET next_run = ? WHERE id = ?",
+                                  [(run, rule_id) for rule_id, run in next_runs])
+
+    def stats(self) -> dict:
+        (rules,) = self.conn.execute("SELECT COUNT(*) FROM recurring_rules").fetchone()
+        return {"rules": rules}
+
+
+class RecurringScheduler:
+    """
+    Background task recording recurring expenses when they fall due.
+
+    Runs at startup (catching up on anything missed while the bot was down),
+    just after midnight Singapore time, every RECURRING_INTERVAL seconds, and
+    whenever `notify` is called. Each run saves due expenses in batches with
+    one ledger transaction per batch and wakes the syncer, which appends
+    each month tab's new rows in one request.
+    """
+
+    def __init__(self, recurring: RecurringExpenses, ledger: Ledger, on_saved=None,
+                 interval: float = RECURRING_INTERVAL):
+        """
+        Args:
+            recurring (RecurringExpenses): Rules to materialise.
+            ledger (Ledger): Store the expenses are saved to.
+            on_saved: Optional coroutine function `on_saved(expenses)` called
+                once per run with every newly saved expense, e.g. to wake the
+                syncer and tell the users.
+            interval (float): Longest time between runs, in seconds.
+        """
+        self.recurring = recurring
+        self.ledger = ledger
+        self._on_saved = on_saved
+        self.interval = interval
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.runs = 0
+        self.recorded = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def notify(self) -> None:
+        """Run now, e.g. because a rule due today was added."""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+
+    def _timeout(self) -> float:
+        """Seconds until the next run: the interval or just after midnight."""
+        now = datetime.now(tz=ZoneInfo("Asia/Singapore"))
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(),
+                                    tzinfo=now.tzinfo)
+        return min(self.interval, (midnight - now).total_seconds() + 1)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Recurring expenses run failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._timeout())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def run_once(self, today: str | None = None) -> int:
+        """Save every due occurrence; return how many new expenses were saved."""
+        today = today or find_date()
+        saved = []
+        try:
+            while True:
+                expenses, next_runs = self.recurring.due(today)
+                if not next_runs:
+                    break
+                # Occurrence IDs are deterministic, so rows saved by an earlier
+                # run that died before advancing its rules are skipped here.
+                existing = self.ledger.existing_ids([e.id for e in expenses])
+                new = [e for e in expenses if e.id not in existing]
+                self.ledger.add_many(new)
+                self.recurring.advance(next_runs)
+                saved.extend(new)
+                # Let handlers run between batches of a large catch-up.
+                await asyncio.sleep(0)
+        finally:
+            # Whatever was committed is reported once per run, even if a
+            # later batch failed.
+            self.runs += 1
+            self.recorded += len(saved)
+            if saved:
+                logger.info("Recorded %d recurring expense(s)", len(saved))
+                if self._on_saved:
+                    await self._on_saved(saved)
+        return len(saved)
+
+    def stats(self) -> dict:
+        return {**self.recurring.stats(), "runs": self.runs, "recorded": self.recorded}
@@ -0,0 +1,112 @@
+"""
+Insights over a period of one or more months.
+
+A period is summed from one source only, so its months compare like with
+like: the ledger's running totals of the user's own rows when the ledger
+holds the whole period, otherwise the month tabs of the user's own
+spreadsheet. The shared default spreadsheet mixes every unrouted user's rows,
+so its users always get the ledger, noting where its history starts.
+"""
+
+import re
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from insights import Totals, format_amount, month_range, summarise, totals_from_aggregates
+from ledger import Ledger
+from spreadsheet import get_month_totals
+from tenants import Tenant, is_shared
+from utils import find_date
+
+MAX_PERIOD_MONTHS = 12
+_LAST_RE = re.compile(r"last\s+(\d+)")
+_MONTH_RE = re.compile(r"(\d{4})-(\d{1,2})")
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_period(text: str, today: str | None = None) -> tuple[list[date], str]:
+    """
+    Parse a period such as '', '2025-03', 'ytd' or 'last 3'.
+
+    Returns:
+        tuple: The first day of every month in the period, oldest first, and
+        a title for it.
+
+    Raises:
+        ValueError: If the period is not understood or lies in the future.
+    """
+    current = date.fromisoformat(today or find_date()).replace(day=1)
+    text = " ".join(text.lower().split())
+    if not text:
+        return [current], "This Month’s Insights"
+    if text == "ytd":
+        return ([date(current.year, m, 1) for m in range(1, current.month + 1)],
+                f"{current.year} Year to Date")
+    match = _LAST_RE.fullmatch(text)
+    if match:
+        n = int(match[1])
+        if not 1 <= n <= MAX_PERIOD_MONTHS:
+            raise ValueError(f"choose between 1 and {MAX_PERIOD_MONTHS} months")
+        return [_add_months(current, i) for i in range(1 - n, 1)], f"Last {n} Months"
+    match = _MONTH_RE.fullmatch(text)
+    if match and 1 <= int(match[2]) <= 12:
+        month = date(int(match[1]), int(match[2]), 1)
+        if month > current:
+            raise ValueError("that month has not started yet")
+        return [month], month.strftime("%B %Y")
+    raise ValueError(f"unknown period {text!r}")
+
+
+def _ledger_covers(first: float | None, month: date) -> bool:
+    """True if ledger rows first recorded at `first` go back to the start of `month`."""
+    began = datetime(month.year, month.month, 1, tzinfo=ZoneInfo("Asia/Singapore")).timestamp()
+    return first is not None and first <= began
+
+
+async def period_insights(ledger: Ledger, tenant: Tenant, user_id, months: list[date],
+                          today: str | None = None) -> dict:
+    """
+    Insights for the given months, with month-over-month totals when the
+    period spans more than one month.
+
+    Returns:
+        dict: The insights.summarise dict of the whole period
+        (`category_breakdown`, `averages`, `spend_types`, `total`), plus a
+        `months` list of (month label, total, change from the previous
+        month) for longer periods and a `note` when the ledger only holds
+        part of the period.
+    """
+    first = ledger.first_recorded(user_id)
+    covered = _ledger_covers(first, months[0])
+    note = None
+    if covered or is_shared(tenant):
+        totals = {month: totals_from_aggregates(ledger.totals(user_id, month.strftime("%Y-%m")))
+                  for month in months}
+        if not covered:
+            since = (datetime.fromtimestamp(first, ZoneInfo("Asia/Singapore")).date().isoformat()
+                     if first is not None else find_date())
+            note = f"Only includes expenses recorded since {since}."
+    else:
+        totals = await get_month_totals(tenant, months)
+
+    merged = Totals()
+    for month in months:
+        merged += totals[month]
+    insights = summarise(merged, months[0], month_range(months[-1])[1], today)
+
+    if len(months) > 1:
+        insights["months"] = []
+        previous = None
+        for month in months:
+            total = totals[month].total
+            change = (f"{(total - previous) / previous:+.1%}"
+                      if previous else "")
+            insights["months"].append((month.strftime("%b %Y"), format_amount(total), change))
+            previous = total
+    if note:
+        insights["note"] = note
+    return insights
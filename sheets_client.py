@@ -0,0 +1,309 @@
+import os
+import heapq
+import random
+import asyncio
+import logging
+import threading
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.errors import HttpError
+
+from credentials import ensure_fresh
+import metrics
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# googleapiclient requests are blocking and httplib2 connections are not
+# thread-safe, so every request runs on a small bounded pool of threads that
+# each own their own authorised connection.
+MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "20"))
+# Connections kept per worker thread, one per credential in use.
+MAX_CONNECTIONS = 32
+
+# Project-wide Sheets quotas, per minute, for read and write requests.
+READ_PER_MINUTE = float(os.getenv("SHEETS_READ_PER_MINUTE", "300"))
+WRITE_PER_MINUTE = float(os.getenv("SHEETS_WRITE_PER_MINUTE", "300"))
+MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Lower numbers are served first when the quota is exhausted.
+PRIORITY_INTERACTIVE = 0   # a user is waiting on the response
+PRIORITY_WRITE = 1         # replicating expenses
+PRIORITY_BACKGROUND = 2    # index refreshes and other housekeeping reads
+
+REQUEST_SECONDS = metrics.histogram(
+    "cashbotic_sheets_request_seconds",
+    "Duration of each Sheets API attempt, by method.", ("method",))
+REQUESTS = metrics.counter(
+    "cashbotic_sheets_requests_total",
+    "Sheets API attempts, by method and outcome (ok, HTTP status, timeout).",
+    ("method", "outcome"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                               thread_name_prefix="sheets")
+_local = threading.local()
+# Key -> requests whose worker thread is still running, see `settled`.
+_running = {}
+
+
+def _thread_http(credentials):
+    """Return an authorised httplib2 connection owned by the current thread."""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    http = connections.get(id(credentials))
+    if http is None or http.credentials is not credentials:
+        if len(connections) >= MAX_CONNECTIONS:
+            connections.clear()
+        http = google_auth_httplib2.AuthorizedHttp(
+            credentials, http=httplib2.Http(timeout=TIMEOUT))
+        connections[id(credentials)] = http
+    return http
+
+
+def _run(request, credentials):
+    # Normally a no-op: the background refresher renews tokens before expiry.
+    ensure_fresh(credentials)
+    return request.execute(http=_thread_http(credentials))
+
+
+class Scheduler:
+    """
+    Admits Sheets requests within the read and write quotas.
+
+    Each kind of request has its own token bucket, and a request may also be
+    charged to a bucket of its own, such as its spreadsheet's limit. A
+    request that finds a bucket empty waits in that bucket's priority queue,
+    so when either limit is tight interactive calls are let through before
+    background ones. Admitted
+    requests then wait for one of the MAX_WORKERS worker slots, which are
+    handed out in priority order across reads and writes, so a backlog of
+    background reads cannot hold every worker while a user waits.
+    """
+
+    def __init__(self):
+        self.buckets = {
+            "read": TokenBucket(READ_PER_MINUTE / 60, READ_PER_MINUTE / 6),
+            "write": TokenBucket(WRITE_PER_MINUTE / 60, WRITE_PER_MINUTE / 6),
+        }
+        # Bucket -> heap of (priority, sequence, future) of the waiting callers.
+        self._waiting = {}
+        self._dispatchers = {}
+        self._busy = 0
+        self._slots = []
+        self._seq = count()
+        self.calls = 0
+        self.throttled = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def acquire(self, kind: str, priority: int, limiter: TokenBucket | None = None) -> None:
+        """Wait until a request of `kind` may be sent, within `limiter` too if given."""
+        self.calls += 1
+        waited = False
+        for bucket in (limiter, self.buckets[kind]):
+            if bucket is not None:
+                waited = await self._take(bucket, priority) or waited
+        if waited:
+            self.throttled += 1
+
+    async def _take(self, bucket: TokenBucket, priority: int) -> bool:
+        """Take a token from `bucket`, in priority order; return whether it waited."""
+        waiting = self._waiting.setdefault(bucket, [])
+        if not waiting and bucket.try_acquire():
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(waiting, (priority, next(self._seq), future))
+        dispatcher = self._dispatchers.get(bucket)
+        if dispatcher is None or dispatcher.done():
+            self._dispatchers[bucket] = asyncio.get_running_loop().create_task(
+                self._dispatch(bucket))
+        await future
+        return True
+
+    async def _dispatch(self, bucket: TokenBucket) -> None:
+        waiting = self._waiting[bucket]
+        while waiting:
+            await asyncio.sleep(bucket.delay())
+            # Skip waiters whose caller gave up (e.g. cancelled on timeout).
+            while waiting and waiting[0][2].done():
+                heapq.heappop(waiting)
+            if waiting and bucket.try_acquire():
+                bucket.waits += 1
+                heapq.heappop(waiting)[2].set_result(None)
+
+    async def claim(self, priority: int) -> None:
+        """Wait for a worker slot; every claim must be followed by `release`."""
+        if self._busy < MAX_WORKERS and not self._slots:
+            self._busy += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._slots, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled after being handed a slot: pass it on.
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Hand the slot to the most urgent waiter, or free it."""
+        while self._slots:
+            future = heapq.heappop(self._slots)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._busy -= 1
+
+    def _queued(self, bucket: TokenBucket) -> int:
+        return len(self._waiting.get(bucket, ()))
+
+    def stats(self) -> dict:
+        shared = set(self.buckets.values())
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "failed": self.failed,
+            "read_waits": self.buckets["read"].waits,
+            "write_waits": self.buckets["write"].waits,
+            "queued_reads": self._queued(self.buckets["read"]),
+            "queued_writes": self._queued(self.buckets["write"]),
+            "limiter_waits": sum(b.waits for b in self._waiting if b not in shared),
+            "queued_for_limiters": sum(self._queued(b) for b in self._waiting if b not in shared),
+            "busy_workers": self._busy,
+            "queued_for_workers": len(self._slots),
+        }
+
+
+scheduler = Scheduler()
+
+
+def _finished(future: asyncio.Future) -> None:
+    """Free the worker slot of a request whose thread has returned."""
+    scheduler.release()
+    if not future.cancelled():
+        # Retrieved here, as a caller that timed out never will.
+        future.exception()
+
+
+def _outcome(error: Exception) -> str:
+    if isinstance(error, HttpError):
+        return str(error.resp.status)
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return "error"
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honour Retry-After when present, else exponential backoff with jitter."""
+    if isinstance(error, HttpError):
+        retry_after = error.resp.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _should_retry(error: Exception, kind: str) -> bool:
+    # A rejected (429) request was never applied, but a write that failed any
+    # other way may still have landed, so only reads are retried blindly.
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        return status == 429 or (kind == "read" and status in RETRYABLE_STATUSES)
+    return kind == "read" and isinstance(error, (asyncio.TimeoutError, OSError,
+                                                  httplib2.HttpLib2Error))
+
+
+async def settled(key) -> None:
+    """Wait until every request executed with `key` has left its worker thread."""
+    running = _running.get(key)
+    if running:
+        await asyncio.wait(list(running))
+
+
+def _track(key, future: asyncio.Future) -> None:
+    running = _running.setdefault(key, set())
+    running.add(future)
+
+    def untrack(_):
+        running.discard(future)
+        if not running and _running.get(key) is running:
+            del _running[key]
+
+    future.add_done_callback(untrack)
+
+
+async def execute(request, credentials, priority: int | None = None,
+                  timeout: float | None = None, limiter: TokenBucket | None = None,
+                  key=None):
+    """
+    Execute a googleapiclient request without blocking the event loop.
+
+    Every attempt, retries included, first waits for `limiter` and the read
+    or write quota, then for one of the MAX_WORKERS worker slots (see
+    Scheduler). A request that takes longer than `timeout` seconds raises
+    asyncio.TimeoutError; its slot is only freed once the worker thread has
+    finished, so no more than MAX_WORKERS requests ever run at once and the
+    timeout never includes time spent waiting for a free thread. Throttled
+    and transient failures are retried up to MAX_RETRIES times with backoff.
+
+    Args:
+        request: An unexecuted googleapiclient HttpRequest.
+        credentials: Google credentials used to authorise the request.
+        priority (int): One of the PRIORITY_* constants; defaults to
+            PRIORITY_WRITE for writes and PRIORITY_BACKGROUND for reads.
+        timeout (float): Per-call timeout in seconds, defaults to SHEETS_TIMEOUT.
+        limiter (TokenBucket): Optional extra limit every attempt is charged
+            to, e.g. the spreadsheet's own.
+        key: Optional hashable; `settled(key)` then waits for the request's
+            worker threads, even after a timeout.
+
+    Returns:
+        dict: The decoded API response.
+    """
+    kind = "read" if request.method == "GET" else "write"
+    if priority is None:
+        priority = PRIORITY_BACKGROUND if kind == "read" else PRIORITY_WRITE
+
+    method = getattr(request, "methodId", "").removeprefix("sheets.spreadsheets.")
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        await scheduler.acquire(kind, priority, limiter)
+        try:
+            await scheduler.claim(priority)
+            try:
+                future = loop.run_in_executor(_executor, _run, request, credentials)
+            except BaseException:
+                scheduler.release()
+                raise
+            future.add_done_callback(_finished)
+            if key is not None:
+                _track(key, future)
+            with metrics.timed(REQUEST_SECONDS, method):
+                # Shielded, so giving up on the request leaves the slot taken
+                # until the thread is actually free again.
+                result = await asyncio.wait_for(asyncio.shield(future),
+                                                timeout=timeout or TIMEOUT)
+            REQUESTS.inc(method, "ok")
+            return result
+        except Exception as e:
+            REQUESTS.inc(method, _outcome(e))
+            if attempt >= MAX_RETRIES or not _should_retry(e, kind):
+                scheduler.failed += 1
+                raise
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            scheduler.retried += 1
+            logger.warning("Sheets %s failed (%s), retry %d in %.1fs",
+                           kind, e, attempt, delay)
+            await asyncio.sleep(delay)
@@ -1,97 +1,235 @@
 import os
-import base64
-import pickle
+import time
+import asyncio
 import logging
 from datetime import date
-from typing import List
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from expenditure import Expenditure
 from dotenv import load_dotenv
-from utils import find_date, find_month, import_spreadsheetID, HEADERS, CATEGORIES
+from utils import find_date, find_month, HEADERS
+from sheets_client import execute, settled, PRIORITY_INTERACTIVE
+from write_queue import WriteBatcher
+from cache import TTLCache
+from insights import month_range, to_columns, totals_from_columns
+from tenants import Tenant, default_tenant
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 load_dotenv()
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# title -> sheetId index of the worksheets in each doc, refreshed after
+# TITLES_TTL seconds or when a write reports that a tab is missing.
+TITLES_TTL = float(os.getenv("SHEETS_TITLES_TTL", "3600"))
 
-def load_google_credentials():
+
+class _TabIndex:
+    def __init__(self):
+        self.sheet_ids: dict[str, int] = {}
+        self.loaded_at: float | None = None
+        self.index_lock = asyncio.Lock()
+        self.tab_lock = asyncio.Lock()
+
+    def stale(self) -> bool:
+        return (self.loaded_at is None
+                or time.monotonic() - self.loaded_at > TITLES_TTL)
+
+
+_tab_indexes: dict[str, _TabIndex] = {}
+
+
+def _tab_index(tenant: Tenant) -> _TabIndex:
+    index = _tab_indexes.get(tenant.spreadsheet_id)
+    if index is None:
+        index = _tab_indexes[tenant.spreadsheet_id] = _TabIndex()
+    return index
+
+
+async def _prepare(tenant: Tenant) -> None:
+    """Load the tenant's credentials and Sheets service without blocking the loop."""
+    await tenant.connect()
+
+
+async def warm_up(tenant: Tenant | None = None) -> None:
     """
-    Load Google OAuth credentials from Railway environment variable.
+    Load credentials, build the Sheets service and fetch the tab index ahead
+    of the first request, logging how long each phase took.
     """
-    b64 = os.environ.get("GOOGLE_TOKEN_PICKLE_B64")
-    if not b64:
-        raise RuntimeError("GOOGLE_TOKEN_PICKLE_B64 not set")
+    tenant = tenant or default_tenant()
+    started = time.perf_counter()
+    await _prepare(tenant)
+    loaded = time.perf_counter()
+    await _get_sheet_ids(tenant)
+    logger.info("Sheets warm-up for %s: credentials+discovery %.3fs, metadata %.3fs",
+                 tenant, loaded - started, time.perf_counter() - loaded)
 
-    logging.info("Loading Google credentials from environment variable")
 
-    token_bytes = base64.b64decode(b64)
-    creds = pickle.loads(token_bytes)
+async def _execute(tenant: Tenant, build, priority: int | None = None, key=None):
+    """
+    Run a Sheets request within the tenant's rate limit and global quota.
+
+    Args:
+        tenant (Tenant): Spreadsheet the request is for.
+        build: Function building the unexecuted request from the tenant's
+            Sheets service.
+        priority (int): See sheets_client.execute.
+        key: See sheets_client.execute.
+    """
+    credentials, service = await tenant.connect()
+    return await execute(build(service), credentials, priority=priority,
+                         limiter=tenant.limiter, key=key)
+
+
+async def _get_sheet_ids(tenant: Tenant, refresh: bool = False) -> dict[str, int]:
+    """Return the cached title -> sheetId index, fetching it when stale."""
+    index = _tab_index(tenant)
+    if not refresh and not index.stale():
+        return index.sheet_ids
+
+    requested_at = time.monotonic()
+    async with index.index_lock:
+        # Concurrent callers share the fetch made by whoever got here first.
+        if index.loaded_at is not None and index.loaded_at >= requested_at:
+            return index.sheet_ids
+        if not refresh and not index.stale():
+            return index.sheet_ids
+        meta = await _execute(tenant, lambda service: service.spreadsheets().get(
+            spreadsheetId=tenant.spreadsheet_id, includeGridData=False,
+            fields="sheets.properties(sheetId,title)"
+        ))
+        index.sheet_ids = {s["properties"]["title"]: s["properties"]["sheetId"]
+                           for s in meta["sheets"]}
+        index.loaded_at = time.monotonic()
+    return index.sheet_ids
+
 
-    return creds
+def _invalidate_titles(tenant: Tenant) -> None:
+    """Force the next lookup to refetch the worksheet index."""
+    _tab_index(tenant).loaded_at = None
 
 
-creds = load_google_credentials()
-service = build("sheets", "v4", credentials=creds, cache_discovery=False)
-SPREADSHEET_ID = import_spreadsheetID()
-MONTH_TAB = find_month()
-titles = [
-    s["properties"]["title"]
-    for s in service.spreadsheets()
-    .get(spreadsheetId=SPREADSHEET_ID, includeGridData=False)
-    .execute()["sheets"]
-]
+def _is_missing_tab_error(e: Exception) -> bool:
+    return (isinstance(e, HttpError) and e.resp.status == 400
+            and "Unable to parse range" in str(e))
 
 
-def _get_titles() -> List[str]:
-    """Return every worksheet title in the doc."""
-    meta = service.spreadsheets().get(
-        spreadsheetId=SPREADSHEET_ID, includeGridData=False
-    ).execute()
-    return [s["properties"]["title"] for s in meta["sheets"]]
+async def sync_rows(tenant: Tenant, month_tab: str, rows: list, verify: bool = False) -> int:
+    """
+    Append ledger rows (HEADERS order, ID last) to a month tab.
+
+    Args:
+        tenant (Tenant): Spreadsheet to write to.
+        month_tab (str): Destination tab, created if missing.
+        rows (list): Rows to append.
+        verify (bool): First drop rows whose ID is already in the tab, for
+            retries of appends that may have landed. Appends to the tab that
+            are still running (e.g. after a timeout) are waited for first.
 
+    Returns:
+        int: Number of rows actually appended.
 
-async def write(expenditure: Expenditure):
+    Raises:
+        Exception: Any error from the Sheets API; no rows are marked written.
+    """
+    await _prepare(tenant)
+    await _ensure_tab(tenant, month_tab)
+    if verify:
+        await settled(_append_key(tenant, month_tab))
+        existing = await _fetch_ids(tenant, month_tab)
+        rows = [row for row in rows if row[-1] not in existing]
+    key = (tenant, month_tab)
+    if len(rows) >= _write_queue.max_batch:
+        # Already a full batch: send it as one append instead of splitting it.
+        await _write_queue.submit_many(key, rows)
+    else:
+        await asyncio.gather(*(_write_queue.submit(key, row) for row in rows))
+    return len(rows)
+
+
+async def _fetch_ids(tenant: Tenant, month_tab: str) -> set:
+    """Return the row IDs already present in a month tab."""
+    column = chr(64 + len(HEADERS))
+    result = await _execute(tenant, lambda service: service.spreadsheets().values().get(
+        spreadsheetId=tenant.spreadsheet_id,
+        range=f"'{month_tab}'!{column}:{column}",
+    ))
+    return {row[0] for row in result.get("values", []) if row}
+
+
+async def _append_rows(key: tuple, rows: list) -> dict:
+    """Append a batch of rows to a (tenant, month tab) in one request."""
+    tenant, month_tab = key
     try:
-        month_tab = _ensure_month_tab()
-        range_name = f"'{month_tab}'!A:E"
-        values = [[expenditure.date, expenditure.product,
-                   expenditure.amount, expenditure.category,
-                   expenditure.spend_type]]
-        body = {'values': values}
-        result = service.spreadsheets().values().append(
-            spreadsheetId=import_spreadsheetID(),
+        return await _send_append(tenant, month_tab, rows)
+    finally:
+        # Even a failed or timed-out append may have landed, so drop the
+        # cached insights either way, including closed months of the tab
+        # (past-dated expenses and imports still land there).
+        _insights_cache.invalidate((tenant.spreadsheet_id, month_tab))
+        for key in [k for k in _closed_months if k[:2] == (tenant.spreadsheet_id, month_tab)]:
+            del _closed_months[key]
+
+
+def _append_key(tenant: Tenant, month_tab: str) -> tuple:
+    return ("append", tenant.spreadsheet_id, month_tab)
+
+
+async def _send_append(tenant: Tenant, month_tab: str, rows: list) -> dict:
+    range_name = f"'{month_tab}'!A:{chr(64+len(HEADERS))}"
+    body = {'values': rows}
+    try:
+        return await _execute(tenant, lambda service: service.spreadsheets().values().append(
+            spreadsheetId=tenant.spreadsheet_id,
             range=range_name,
             valueInputOption='USER_ENTERED',
             body=body
-        ).execute()
-        return result
-    except Exception as e:
-        logging.exception(f"Error writing to spreadsheet: {e}")
-        return None
+        ), key=_append_key(tenant, month_tab))
+    except HttpError as e:
+        if not _is_missing_tab_error(e):
+            raise
+        # The tab was deleted or renamed behind our back: rebuild the index,
+        # recreate the tab and retry once.
+        logger.warning("Tab «%s» not found, refreshing index", month_tab)
+        _invalidate_titles(tenant)
+        await _ensure_tab(tenant, month_tab)
+        return await _execute(tenant, lambda service: service.spreadsheets().values().append(
+            spreadsheetId=tenant.spreadsheet_id,
+            range=range_name,
+            valueInputOption='USER_ENTERED',
+            body=body
+        ), key=_append_key(tenant, month_tab))
+
+
+_write_queue = WriteBatcher(_append_rows)
+_insights_cache = TTLCache(float(os.getenv("INSIGHTS_CACHE_TTL", "300")))
+# (spreadsheet ID, tab, first day of month) -> Totals of a month that is over.
+_closed_months = {}
+
+
+async def drain() -> None:
+    """Flush every queued row; call once on shutdown."""
+    await _write_queue.close()
+
+
+def write_stats() -> dict:
+    """Batch-size and flush-latency counters of the write-behind queue."""
+    return _write_queue.stats()
 
 '''
 Sheet creation
 '''
 
 
-def _add_headers(sheet_id: int, title: str) -> None:
+async def _add_headers(tenant: Tenant, sheet_id: int, title: str) -> None:
     """Write header row + centre it."""
-    logging.info("ADDING HEADERS")
 
-    service.spreadsheets().values().update(
-        spreadsheetId=SPREADSHEET_ID,
+    await _execute(tenant, lambda service: service.spreadsheets().values().update(
+        spreadsheetId=tenant.spreadsheet_id,
         range=f"{title}!A1:{chr(64+len(HEADERS))}1",
         valueInputOption="USER_ENTERED",
         body={"values": [HEADERS]},
-    ).execute()
+    ))
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=SPREADSHEET_ID,
+    await _execute(tenant, lambda service: service.spreadsheets().batchUpdate(
+        spreadsheetId=tenant.spreadsheet_id,
         body={
             "requests": [
                 {
@@ -114,93 +252,93 @@ def _add_headers(sheet_id: int, title: str) -> None:
                 }
             ]
         },
-    ).execute()
+    ))
 
 
-def _create_month_tab(title: str) -> None:
+async def _create_month_tab(tenant: Tenant, title: str) -> None:
     """Make a new tab for the month and seed headers."""
-    res = service.spreadsheets().batchUpdate(
-        spreadsheetId=SPREADSHEET_ID,
+    res = await _execute(tenant, lambda service: service.spreadsheets().batchUpdate(
+        spreadsheetId=tenant.spreadsheet_id,
         body={"requests": [{"addSheet": {"properties": {"title": title}}}]},
-    ).execute()
+    ))
     sheet_id = res["replies"][0]["addSheet"]["properties"]["sheetId"]
-    _add_headers(sheet_id, title)
-    logging.info(f"Created tab «{title}» ({sheet_id})")
+    _tab_index(tenant).sheet_ids[title] = sheet_id
+    await _add_headers(tenant, sheet_id, title)
+    logger.info("Created tab «%s» (%s)", title, sheet_id)
+
+
+async def _ensure_tab(tenant: Tenant, title: str) -> str:
+    """Return the tab name, creating it if missing."""
+    if title in await _get_sheet_ids(tenant):
+        return title
+
+    index = _tab_index(tenant)
+    async with index.tab_lock:
+        # Another writer may have created the tab while we waited, either in
+        # this process (index already updated) or elsewhere (refetch).
+        if (title in index.sheet_ids
+                or title in await _get_sheet_ids(tenant, refresh=True)):
+            return title
+        await _create_month_tab(tenant, title)
+    return title
 
 
-def _ensure_month_tab() -> str:
-    """Return the current‑month tab name, creating it if missing."""
-    title = find_month()
-    if title not in _get_titles():
-        _create_month_tab(title)
-    return title
+async def get_month_totals(tenant: Tenant, months: list) -> dict:
+    """
+    Return the Totals of each month (given by its first day) from the
+    tenant's month tabs, reading every tab that is needed in one batchGet.
 
+    A tab holds its month of every year, so each month is cut out of its tab
+    by date. Closed months are cached until their tab is written to again;
+    the current month for INSIGHTS_CACHE_TTL seconds.
+    """
+    current = date.fromisoformat(find_date()).replace(day=1)
+    result, missing = {}, []
+    for month in months:
+        tab = find_month(month.isoformat())
+        if month < current:
+            totals = _closed_months.get((tenant.spreadsheet_id, tab, month))
+        else:
+            cached = _insights_cache.get((tenant.spreadsheet_id, tab))
+            totals = cached[1] if cached and cached[0] == month else None
+        if totals is None:
+            missing.append(month)
+        else:
+            result[month] = totals
+    if not missing:
+        return result
 
-def get_insights() -> dict:
-    monthly_results = fetch_monthly_insights(find_month())
-    insights = parse_monthly_insights(monthly_results)
-    logging.info("INSIGHTS 123")
-    logging.info(insights)
-    return insights
-
-
-def fetch_monthly_insights(month_tab):
-    ranges = [
-        f"'{month_tab}'!G2:H11",   # category breakdown
-        f"'{month_tab}'!J3",       # avg weekday
-        f"'{month_tab}'!J6",       # avg weekend
-        f"'{month_tab}'!J9",       # percentage diff
-        f"'{month_tab}'!G14",      # recurring
-        f"'{month_tab}'!G17",      # essential
-        f"'{month_tab}'!G20",      # discretionary
-        f"'{month_tab}'!G23",      # one-off
-        f"'{month_tab}'!H25",      # total
-    ]
-
-    result = service.spreadsheets().values().batchGet(
-        spreadsheetId=import_spreadsheetID(),
-        ranges=ranges,
-        valueRenderOption="FORMATTED_VALUE"
-    ).execute()
-
-    return result.get("valueRanges", [])
-
-
-def parse_monthly_insights(value_ranges):
-    # 1. Category breakdown
-    rows = value_ranges[0].get("values", [])
-
-    category_breakdown = {
-        row[0]: row[1] if len(row) > 1 else "0"
-        for row in rows
-    }
-
-    # 2. Averages
-    avg_weekday = value_ranges[1].get("values", [["0"]])[0][0]
-    avg_weekend = value_ranges[2].get("values", [["0"]])[0][0]
-    pct_diff = value_ranges[3].get("values", [["N/A"]])[0][0]
-
-    # 3. Spend types
-    recurring = value_ranges[4].get("values", [["0"]])[0][0]
-    essential = value_ranges[5].get("values", [["0"]])[0][0]
-    discretionary = value_ranges[6].get("values", [["0"]])[0][0]
-    one_off = value_ranges[7].get("values", [["0"]])[0][0]
-
-    # 4. Total
-    total = value_ranges[8].get("values", [["0"]])[0][0]
-    
-    return {
-        "category_breakdown": category_breakdown,
-        "averages": {
-            "weekday": avg_weekday,
-            "weekend": avg_weekend,
-            "percentage_diff": pct_diff,
-        },
-        "spend_types": {
-            "recurring": recurring,
-            "essential": essential,
-            "discretionary": discretionary,
-            "one_off": one_off,
-        },
-        "total": total
-    }
+    await _prepare(tenant)
+    existing = await _get_sheet_ids(tenant)
+    tabs = [tab for tab in dict.fromkeys(find_month(m.isoformat()) for m in missing)
+            if tab in existing]
+    rows_by_tab = await fetch_tabs_rows(tenant, tabs) if tabs else {}
+    for tab in dict.fromkeys(find_month(m.isoformat()) for m in missing):
+        # One pass over each tab's rows serves every month it holds.
+        columns = to_columns(rows_by_tab.get(tab, []))
+        for month in missing:
+            if find_month(month.isoformat()) != tab:
+                continue
+            totals = result[month] = totals_from_columns(columns, *month_range(month))
+            if month < current:
+                _closed_months[(tenant.spreadsheet_id, tab, month)] = totals
+            else:
+                _insights_cache.set((tenant.spreadsheet_id, tab), (month, totals))
+    return result
+
+
+def insights_cache_stats() -> dict:
+    """Hit/miss counters of the insights cache."""
+    return {**_insights_cache.stats(), "closed_months": len(_closed_months)}
+
+
+async def fetch_tabs_rows(tenant: Tenant, month_tabs: list) -> dict:
+    """Read every expense row of several month tabs in one request."""
+    result = await _execute(tenant, lambda service: service.spreadsheets().values().batchGet(
+        spreadsheetId=tenant.spreadsheet_id,
+        ranges=[f"'{tab}'!A:{chr(64+len(HEADERS))}" for tab in month_tabs],
+        valueRenderOption="UNFORMATTED_VALUE",
+        dateTimeRenderOption="SERIAL_NUMBER"
+    ), priority=PRIORITY_INTERACTIVE)
+    return {tab: value_range.get("values", [])
+            for tab, value_range in zip(month_tabs, result.get("valueRanges", []))}
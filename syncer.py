@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+from ledger import Ledger
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "5"))
+SYNC_BATCH = int(os.getenv("SYNC_BATCH", "500"))
+SYNC_LAG_WARNING = float(os.getenv("SYNC_LAG_WARNING", "300"))
+
+
+class LedgerSyncer:
+    """
+    Background task replicating unsynced ledger rows to their month tabs.
+
+    Runs every SYNC_INTERVAL seconds, or as soon as `notify` is called after
+    a new expense is committed. Every attempt is counted in the ledger
+    before it is made, and rows attempted before are checked against the IDs
+    already in the tab first: an append that failed, timed out or was cut
+    short by a restart may still have landed. Failed rows are retried with
+    backoff.
+    """
+
+    def __init__(self, ledger: Ledger, sync_rows, route, interval: float = SYNC_INTERVAL,
+                 batch: int = SYNC_BATCH):
+        """
+        Args:
+            ledger (Ledger): Store to replicate from.
+            sync_rows: Coroutine function `sync_rows(tenant, month_tab, rows, verify)`.
+            route: Function mapping a row's user ID to its tenant.
+            interval (float): Seconds between passes when not notified.
+            batch (int): Maximum rows read from the ledger per pass.
+        """
+        self.ledger = ledger
+        self._sync_rows = sync_rows
+        self._route = route
+        self.interval = interval
+        self.batch = batch
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.synced = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def notify(self) -> None:
+        """Wake the syncer up because new rows were committed."""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        """Stop the background loop and make one last replication pass."""
+        if self._task is not None:
+            # Let a pass in flight finish rather than cancelling it: its rows
+            # may already be appended without being marked synced yet, and
+            # the last pass would append them again.
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.sync_once()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                # Keep going while full batches come back (e.g. after an
+                # import) instead of waiting an interval between them.
+                while await self.sync_once() >= self.batch:
+                    pass
+            except Exception:
+                logger.exception("Ledger sync pass failed")
+
+    async def sync_once(self) -> int:
+        """Replicate one batch of due rows; return how many were synced."""
+        groups = {}
+        for row in self.ledger.unsynced(self.batch):
+            key = (self._route(row["user_id"]), row["month_tab"])
+            groups.setdefault(key, []).append(row)
+
+        # Different tabs and tenants are independent, so sync them concurrently.
+        results = await asyncio.gather(*(
+            self._sync_group(tenant, month_tab, group)
+            for (tenant, month_tab), group in groups.items()
+        ))
+        done = sum(results)
+        self.synced += done
+        lag = self.ledger.sync_lag()
+        if lag["lag_seconds"] > SYNC_LAG_WARNING:
+            logger.warning("Sheets sync is %.0fs behind (%d rows unsynced)",
+                           lag["lag_seconds"], lag["unsynced"])
+        return done
+
+    async def _sync_group(self, tenant, month_tab: str, group: list) -> int:
+        ids = [r["id"] for r in group]
+        # Sheet rows in utils.HEADERS order.
+        values = [[r["date"], r["product"], r["amount"], r["category"],
+                   r["spend_type"], r["id"]] for r in group]
+        verify = any(r["sync_attempts"] for r in group)
+        self.ledger.mark_attempted(ids)
+        try:
+            await self._sync_rows(tenant, month_tab, values, verify=verify)
+        except Exception:
+            logger.exception("Failed to sync %d row(s) to %s of %s",
+                             len(ids), month_tab, tenant)
+            self.failures += 1
+            self.ledger.mark_failed(ids)
+            return 0
+        self.ledger.mark_synced(ids)
+        return len(ids)
+
+    def stats(self) -> dict:
+        return {"synced": self.synced, "failures": self.failures,
+                **self.ledger.sync_lag()}
@@ -8,16 +8,49 @@ Base methods for calendar keyboard creation and processing.
 """
 
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup,ReplyKeyboardRemove
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from zoneinfo import ZoneInfo
 import datetime
 import calendar
-import messages
-import utils
+import functools
+import os
+import re
 
+CALENDAR_CACHE_SIZE = int(os.getenv("CALENDAR_CACHE_SIZE", "24"))
 
-def create_callback_data(action,year,month,day):
+# Compact callback data, e.g. "cal;d;2025;4;10", far below Telegram's 64 bytes.
+CALLBACK_PREFIX = "cal"
+IGNORE = "i"
+DAY = "d"
+PREV_MONTH = "p"
+NEXT_MONTH = "n"
+# Matches every calendar button, for CallbackQueryHandler(pattern=...).
+CALLBACK_PATTERN = re.compile(rf"^(?:{CALLBACK_PREFIX}|CALENDAR);")
+
+# Actions of keyboards sent before the compact encoding.
+_LEGACY_ACTIONS = {"IGNORE": IGNORE, "DAY": DAY,
+                   "PREV-MONTH": PREV_MONTH, "NEXT-MONTH": NEXT_MONTH}
+DATA_IGNORE = f"{CALLBACK_PREFIX};{IGNORE}"
+
+
+def create_callback_data(action,year=None,month=None,day=None):
     """ Create the callback data associated to each button"""
-    return messages.CALENDAR_CALLBACK + ";" + ";".join([action,str(year),str(month),str(day)])
+    fields = [CALLBACK_PREFIX, action] + [str(f) for f in (year, month, day) if f is not None]
+    return ";".join(fields)
+
+
+def separate_callback_data(data):
+    """
+    Split callback data into (action, year, month, day); missing fields are None.
+    :raises ValueError: If the data is not calendar callback data.
+    """
+    prefix, action, *fields = data.split(";")
+    if prefix == "CALENDAR":
+        action = _LEGACY_ACTIONS.get(action, action)
+    elif prefix != CALLBACK_PREFIX:
+        raise ValueError(f"Not calendar callback data: {data!r}")
+    year, month, day = (list(map(int, fields)) + [None] * 3)[:3]
+    return action, year, month, day
 
 
 def create_calendar(year=None,month=None):
@@ -27,19 +60,26 @@ def create_calendar(year=None,month=None):
     :param int month: Month to use in the calendar, if None the current month is used.
     :return: Returns the InlineKeyboardMarkup object with the calendar.
     """
-    now = datetime.datetime.now()
+    # The default month is resolved on every call, so the "current month"
+    # view rolls over with the date while the markups stay cached.
+    now = datetime.datetime.now(tz=ZoneInfo("Asia/Singapore"))
     if year == None: year = now.year
     if month == None: month = now.month
-    data_ignore = create_callback_data("IGNORE", year, month, 0)
+    return _build_calendar(year, month)
+
+
+@functools.lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _build_calendar(year, month):
+    """Build the markup of one month; markups are immutable, so they are shared."""
     keyboard = []
     #First row - Month and Year
     row=[]
-    row.append(InlineKeyboardButton(calendar.month_name[month]+" "+str(year),callback_data=data_ignore))
+    row.append(InlineKeyboardButton(calendar.month_name[month]+" "+str(year),callback_data=DATA_IGNORE))
     keyboard.append(row)
     #Second row - Week Days
     row=[]
     for day in ["Mo","Tu","We","Th","Fr","Sa","Su"]:
-        row.append(InlineKeyboardButton(day,callback_data=data_ignore))
+        row.append(InlineKeyboardButton(day,callback_data=DATA_IGNORE))
     keyboard.append(row)
 
     my_calendar = calendar.monthcalendar(year, month)
@@ -47,55 +87,47 @@ def create_calendar(year=None,month=None):
         row=[]
         for day in week:
             if(day==0):
-                row.append(InlineKeyboardButton(" ",callback_data=data_ignore))
+                row.append(InlineKeyboardButton(" ",callback_data=DATA_IGNORE))
             else:
-                row.append(InlineKeyboardButton(str(day),callback_data=create_callback_data("DAY",year,month,day)))
+                row.append(InlineKeyboardButton(str(day),callback_data=create_callback_data(DAY,year,month,day)))
         keyboard.append(row)
     #Last row - Buttons
     row=[]
-    row.append(InlineKeyboardButton("<",callback_data=create_callback_data("PREV-MONTH",year,month,day)))
-    row.append(InlineKeyboardButton(" ",callback_data=data_ignore))
-    row.append(InlineKeyboardButton(">",callback_data=create_callback_data("NEXT-MONTH",year,month,day)))
+    row.append(InlineKeyboardButton("<",callback_data=create_callback_data(PREV_MONTH,year,month)))
+    row.append(InlineKeyboardButton(" ",callback_data=DATA_IGNORE))
+    row.append(InlineKeyboardButton(">",callback_data=create_callback_data(NEXT_MONTH,year,month)))
     keyboard.append(row)
 
     return InlineKeyboardMarkup(keyboard)
 
 
-def process_calendar_selection(update,context):
+async def process_calendar_selection(update,context):
     """
-    Process the callback_query. This method generates a new calendar if forward or
-    backward is pressed. This method should be called inside a CallbackQueryHandler.
-    :param telegram.Bot bot: The bot, as provided by the CallbackQueryHandler
+    Process the callback_query. This method shows the previous or next month
+    if one of the arrows is pressed, by editing only the message's keyboard.
+    It answers the callback query itself, so handlers must not answer it too.
     :param telegram.Update update: The update, as provided by the CallbackQueryHandler
-    :return: Returns a tuple (Boolean,datetime.datetime), indicating if a date is selected
+    :param context: The context, as provided by the CallbackQueryHandler
+    :return: Returns a tuple (Boolean,datetime.date), indicating if a date is selected
                 and returning the date if so.
     """
-    ret_data = (False,None)
     query = update.callback_query
-    # print(query)
-    (_,action,year,month,day) = utils.separate_callback_data(query.data)
-    curr = datetime.datetime(int(year), int(month), 1)
-    if action == "IGNORE":
-        context.bot.answer_callback_query(callback_query_id= query.id)
-    elif action == "DAY":
-        context.bot.edit_message_text(text=query.message.text,
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id
-            )
-        ret_data = True,datetime.datetime(int(year),int(month),int(day))
-    elif action == "PREV-MONTH":
-        pre = curr - datetime.timedelta(days=1)
-        context.bot.edit_message_text(text=query.message.text,
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-            reply_markup=create_calendar(int(pre.year),int(pre.month)))
-    elif action == "NEXT-MONTH":
-        ne = curr + datetime.timedelta(days=31)
-        context.bot.edit_message_text(text=query.message.text,
-            chat_id=query.message.chat_id,
-            message_id=query.message.message_id,
-            reply_markup=create_calendar(int(ne.year),int(ne.month)))
+    try:
+        action, year, month, day = separate_callback_data(query.data)
+    except ValueError:
+        await query.answer(text="Something went wrong!")
+        return False, None
+
+    # Taps on headers and blank cells change nothing: answer them without
+    # another Bot API call.
+    await query.answer()
+    if action == DAY:
+        return True, datetime.date(year, month, day)
+    if action == PREV_MONTH:
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    elif action == NEXT_MONTH:
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
     else:
-        context.bot.answer_callback_query(callback_query_id= query.id,text="Something went wrong!")
-        # UNKNOWN
-    return ret_data
+        return False, None
+    await query.edit_message_reply_markup(reply_markup=create_calendar(year, month))
+    return False, None
@@ -0,0 +1,143 @@
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+
+from credentials import load_google_credentials
+from ratelimit import TokenBucket
+from utils import import_spreadsheetID
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file routing Telegram users to their own spreadsheet:
+# {"<telegram user id>": {"spreadsheet_id": "...", "token_env": "<ENV VAR>"}}
+# `token_env` names the environment variable holding that tenant's pickled
+# credentials (base64); users not listed use the default tenant.
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+DEFAULT_TOKEN_ENV = "GOOGLE_TOKEN_PICKLE_B64"
+SERVICE_POOL_SIZE = int(os.getenv("SHEETS_SERVICE_POOL_SIZE", "32"))
+TENANT_RATE = float(os.getenv("TENANT_RATE", "1"))
+TENANT_BURST = float(os.getenv("TENANT_BURST", "10"))
+# Alternative Sheets API root, e.g. a local fake server for benchmarks.
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT")
+
+
+class ServicePool:
+    """
+    LRU pool of built Sheets services, one per credential.
+
+    Building a service parses the whole discovery document, so services are
+    kept around and only the least recently used one is dropped once the pool
+    holds `size` entries.
+    """
+
+    def __init__(self, size: int = SERVICE_POOL_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._building = {}
+        self.builds = 0
+
+    def get(self, token_env: str):
+        """Return (credentials, service) for the credential in `token_env`."""
+        entry = self._entries.get(token_env)
+        if entry is not None:
+            self._entries.move_to_end(token_env)
+            return entry
+
+        # Imported on first use: the discovery module alone takes a few
+        # hundred milliseconds to import.
+        from googleapiclient.discovery import build
+
+        creds = load_google_credentials(token_env)
+        client_options = {"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+        service = build("sheets", "v4", credentials=creds, cache_discovery=False,
+                        client_options=client_options)
+        self.builds += 1
+        entry = (creds, service)
+        self._entries[token_env] = entry
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def aget(self, token_env: str):
+        """Like `get`, but builds a missing service off the event loop."""
+        if token_env in self._entries:
+            return self.get(token_env)
+        # Concurrent callers wait on the same build.
+        future = self._building.get(token_env)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self.get, token_env)
+            self._building[token_env] = future
+            future.add_done_callback(lambda _: self._building.pop(token_env, None))
+        return await future
+
+    def credentials(self) -> list:
+        """Credentials of every pooled service."""
+        return [creds for creds, _ in self._entries.values()]
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "builds": self.builds}
+
+
+pool = ServicePool()
+
+
+class Tenant:
+    """A spreadsheet and the credential used to reach it."""
+
+    def __init__(self, spreadsheet_id: str, token_env: str = DEFAULT_TOKEN_ENV):
+        self.spreadsheet_id = spreadsheet_id
+        self.token_env = token_env
+        # Limits this spreadsheet's requests, so one busy spreadsheet cannot
+        # use up the project-wide quota of the others. Every user routed to
+        # it shares the bucket: it does not protect them from each other.
+        self.limiter = TokenBucket(TENANT_RATE, TENANT_BURST)
+
+    async def connect(self):
+        """Return (credentials, service), building them off the event loop if needed."""
+        return await pool.aget(self.token_env)
+
+    def __repr__(self):
+        return f"Tenant({self.spreadsheet_id!r})"
+
+
+_tenants = {}
+_routes = None
+
+
+def _load_routes() -> dict:
+    if not os.path.exists(TENANTS_FILE):
+        return {}
+    with open(TENANTS_FILE) as f:
+        routes = json.load(f)
+    logger.info("Loaded %d tenant route(s) from %s", len(routes), TENANTS_FILE)
+    return {str(user): entry for user, entry in routes.items()}
+
+
+def _tenant(spreadsheet_id: str, token_env: str) -> Tenant:
+    key = (spreadsheet_id, token_env)
+    if key not in _tenants:
+        _tenants[key] = Tenant(spreadsheet_id, token_env)
+    return _tenants[key]
+
+
+def default_tenant() -> Tenant:
+    return _tenant(import_spreadsheetID(), DEFAULT_TOKEN_ENV)
+
+
+def is_shared(tenant: Tenant) -> bool:
+    """True for the default tenant, whose tabs hold every unrouted user's rows."""
+    return tenant is default_tenant()
+
+
+def tenant_for(user_id) -> Tenant:
+    """Return the tenant a Telegram user's expenses are routed to."""
+    global _routes
+    if _routes is None:
+        _routes = _load_routes()
+    route = _routes.get(str(user_id))
+    if route is None:
+        return default_tenant()
+    return _tenant(route["spreadsheet_id"],
+                   route.get("token_env", DEFAULT_TOKEN_ENV))
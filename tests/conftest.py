@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read their settings from the environment when first imported, so
+# the bot's files must point at a scratch directory before anything is.
+_workdir = tempfile.mkdtemp(prefix="cashbotic-tests-")
+os.environ.update(TOKEN="123456:test", SPREADSHEET_ID="test",
+                  LEDGER_PATH=os.path.join(_workdir, "ledger.db"),
+                  TENANTS_FILE=os.path.join(_workdir, "tenants.json"),
+                  TOKEN_CACHE_DIR=os.path.join(_workdir, "tokens"))
+
+from ledger import Ledger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture(scope="session")
+def bot():
+    """The bot module, importable without network access or credentials."""
+    import bot
+    return bot
@@ -0,0 +1,69 @@
+import pytest
+
+from budgets import Budgets
+from expenditure import Expenditure
+
+
+def expense(amount, category="Food", date="2025-03-10", user_id=1):
+    expenditure = Expenditure("item", amount, date, category, user_id)
+    expenditure.set_spend_type()
+    return expenditure
+
+
+def save(ledger, budgets, *expenses):
+    """Commit like record_expenses does, then check the budgets."""
+    ledger.add_many(expenses)
+    return budgets.check(1, expenses)
+
+
+@pytest.fixture
+def budgets(ledger):
+    return Budgets(ledger.conn)
+
+
+def test_names_resolve_to_categories_and_spend_types(budgets):
+    assert budgets.set(1, "food", 100) == "Food"
+    assert budgets.set(1, "DISCRETIONARY", 50) == "Discretionary"
+    with pytest.raises(ValueError):
+        budgets.set(1, "Income", 100)
+    with pytest.raises(ValueError):
+        budgets.set(1, "Snacks", 100)
+
+
+def test_negative_limit_is_rejected_and_keeps_the_budget(budgets):
+    budgets.set(1, "Food", 100)
+    with pytest.raises(ValueError, match="negative"):
+        budgets.set(1, "Food", -5)
+    assert [name for name, _, _ in budgets.status(1, "2025-03")] == ["Food"]
+
+
+def test_zero_limit_removes_the_budget(budgets):
+    budgets.set(1, "Food", 100)
+    budgets.set(1, "Food", 0)
+    assert budgets.status(1, "2025-03") == []
+
+
+def test_each_threshold_alerts_once_when_crossed(ledger, budgets):
+    budgets.set(1, "Food", 100)
+    assert save(ledger, budgets, expense(50)) == []
+    first = save(ledger, budgets, expense(30))            # 50 -> 80: reaches 80%
+    assert len(first) == 1 and first[0].startswith("⚠️ Food")
+    assert save(ledger, budgets, expense(10)) == []       # 80 -> 90: nothing new
+    over = save(ledger, budgets, expense(15))             # 90 -> 105: over the limit
+    assert len(over) == 1 and over[0].startswith("🚨 Food") and "105%" in over[0]
+    assert save(ledger, budgets, expense(5)) == []
+
+
+def test_one_save_crossing_both_thresholds_alerts_once(ledger, budgets):
+    budgets.set(1, "Food", 100)
+    assert len(save(ledger, budgets, expense(60), expense(60))) == 1
+
+
+def test_spend_type_budgets_and_other_months(ledger, budgets):
+    budgets.set(1, "Discretionary", 100)
+    alerts = save(ledger, budgets, expense(90, "Shopping"))
+    assert alerts and "Discretionary" in alerts[0] and "2025-03" in alerts[0]
+    # Spending in another month, category or by a refund does not add up.
+    assert save(ledger, budgets, expense(50, "Shopping", date="2025-04-01")) == []
+    assert save(ledger, budgets, expense(500, "Food")) == []
+    assert save(ledger, budgets, expense(-20, "Shopping")) == []
@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+from dedup import UpdateDeduplicator
+from importer import import_expenses
+
+
+def test_redelivered_updates_are_dropped():
+    dedup = UpdateDeduplicator(1, capacity=3)
+    assert dedup.check_and_add(10) is True
+    assert dedup.check_and_add(10) is False
+    assert dedup.stats() == {"tracked": 1, "duplicates": 1}
+
+
+def test_oldest_ids_are_evicted_beyond_capacity():
+    dedup = UpdateDeduplicator(1, capacity=2)
+    for update_id in (1, 2, 3):
+        dedup.check_and_add(update_id)
+    assert dedup.check_and_add(1) is True
+    assert dedup.check_and_add(3) is False
+
+
+def test_forgotten_id_seen_again_survives_eviction_of_its_old_slot():
+    dedup = UpdateDeduplicator(1, capacity=3)
+    dedup.check_and_add(1)
+    dedup.check_and_add(2)
+    dedup.forget(1)
+    dedup.check_and_add(1)
+    dedup.check_and_add(3)
+    dedup.check_and_add(4)  # evicts 2, the oldest live ID
+    assert dedup.check_and_add(1) is False
+    assert dedup.check_and_add(2) is True
+
+
+def test_seen_ids_persist_across_restarts(ledger):
+    UpdateDeduplicator(1, conn=ledger.conn).check_and_add(42)
+    restarted = UpdateDeduplicator(1, conn=ledger.conn)
+    assert restarted.check_and_add(42) is False
+    assert UpdateDeduplicator(2, conn=ledger.conn).check_and_add(42) is True
+
+
+def test_forget_also_unpersists(ledger):
+    dedup = UpdateDeduplicator(1, conn=ledger.conn)
+    dedup.check_and_add(42)
+    dedup.forget(42)
+    assert UpdateDeduplicator(1, conn=ledger.conn).check_and_add(42) is True
+
+
+def test_reimporting_the_same_source_adds_nothing(ledger):
+    lines = ["2025-03-01,Coffee,3.50,Food", "2025-03-02,Taxi,12,Transport"]
+    first = asyncio.run(import_expenses(lines, ledger, 1, "file-hash"))
+    again = asyncio.run(import_expenses(lines, ledger, 1, "file-hash"))
+    assert (first.imported, again.imported, again.duplicates) == (2, 0, 2)
+    assert ledger.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0] == 2
+
+
+def test_redelivered_expense_message_is_saved_once(bot):
+    sent = []
+
+    async def reply(text, **kwargs):
+        sent.append(text)
+
+    async def send_message(chat_id, text, **kwargs):
+        sent.append(text)
+
+    def message_update():
+        return SimpleNamespace(
+            message=SimpleNamespace(text="Coffee 3.50 Food; Bus 2 Transport",
+                                    message_id=7, reply_text=reply),
+            effective_chat=SimpleNamespace(id=555), effective_user=SimpleNamespace(id=555))
+
+    context = SimpleNamespace(user_data={}, bot=SimpleNamespace(send_message=send_message))
+    count = "SELECT COUNT(*) FROM expenses WHERE user_id = 555"
+    for _ in range(2):
+        asyncio.run(bot.validate_and_prompt_category(message_update(), context))
+    assert bot.ledger.conn.execute(count).fetchone()[0] == 2
+    assert bot.ledger.verify_aggregates() == []
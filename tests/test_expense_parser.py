@@ -0,0 +1,66 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from expense_parser import parse_expense, parse_expenses
+
+
+@pytest.mark.parametrize("text, product, amount", [
+    ("Coffee-3.50", "Coffee", 3.5),
+    ("Coffee - 3.50", "Coffee", 3.5),
+    ("coffee 3.5", "coffee", 3.5),
+    ("Coca-Cola-2.50", "Coca-Cola", 2.5),
+    ("Coca-Cola 2.50", "Coca-Cola", 2.5),
+    ("Rent $1,200", "Rent", 1200.0),
+    ("Hotel €99.90", "Hotel", 99.9),
+    ("refund -5", "refund", -5.0),
+    ("Refund--5", "Refund", -5.0),
+    ("Refund $-12", "Refund", -12.0),
+    ("Refund -$12", "Refund", -12.0),
+])
+def test_product_and_amount(text, product, amount):
+    expenditure = parse_expense(text, date="2025-03-01")
+    assert (expenditure.product, expenditure.amount) == (product, amount)
+    assert expenditure.date == "2025-03-01"
+    assert expenditure.category == ""
+
+
+def test_trailing_category_is_case_insensitive_and_sets_spend_type():
+    expenditure = parse_expense("netflix 15.98 subscriptions")
+    assert expenditure.category == "Subscriptions"
+    assert expenditure.spend_type == "Recurring"
+
+
+def test_unknown_trailing_word_stays_in_the_product():
+    expenditure = parse_expense("lunch special 12")
+    assert (expenditure.product, expenditure.category) == ("lunch special", "")
+
+
+@pytest.mark.parametrize("text, date", [
+    ("2025-03-04 Coffee 3", "2025-03-04"),
+    ("04/03/2025 Coffee 3", "2025-03-04"),
+    ("04/03/25 Coffee 3", "2025-03-04"),
+    ("04/03 - Coffee 3", f"{datetime.now(tz=ZoneInfo('Asia/Singapore')).year}-03-04"),
+])
+def test_inline_date_overrides_the_default(text, date):
+    expenditure = parse_expense(text, date="2025-01-01")
+    assert (expenditure.product, expenditure.date) == ("Coffee", date)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("just words", "cannot read"),
+    ("3.50", "cannot read"),
+    ("31/02/2025 Coffee 3", "invalid date"),
+])
+def test_unreadable_items(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_expense(text)
+
+
+def test_several_items_per_message_with_errors_collected():
+    expenses, errors = parse_expenses("Coffee 3; Lunch 12 food\n\nnonsense\nTaxi-8.20",
+                                      date="2025-03-01")
+    assert [(e.product, e.amount, e.category) for e in expenses] == [
+        ("Coffee", 3.0, ""), ("Lunch", 12.0, "Food"), ("Taxi", 8.2, "")]
+    assert errors == ["cannot read 'nonsense'"]
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from classifier import CategoryClassifier
+from importer import import_expenses
+
+HISTORY = ["2025-01-0{day},Flat white coffee,4.50,Food".format(day=day) for day in range(1, 5)]
+
+
+def run_import(ledger, lines, source, classifier=None):
+    return asyncio.run(import_expenses(lines, ledger, 1, source, chunk=2, classifier=classifier))
+
+
+def categories(ledger):
+    return dict(ledger.conn.execute("SELECT product, category FROM expenses"))
+
+
+def test_missing_categories_are_suggested_and_learned(ledger):
+    classifier = CategoryClassifier(ledger.conn)
+    report = run_import(ledger, HISTORY + ["2025-02-01,Iced coffee,5", "2025-02-02,Stapler,12"],
+                        "history", classifier)
+    assert report.imported == 6 and report.uncategorised == 1
+    assert categories(ledger)["Iced coffee"] == "Food"
+    assert categories(ledger)["Stapler"] == ""
+    # Rows imported while the index was already loaded are counted once.
+    assert classifier.index(1)["coffee"] == {"Food": 5}
+
+
+def test_reimport_is_not_learned_twice(ledger):
+    classifier = CategoryClassifier(ledger.conn)
+    run_import(ledger, HISTORY, "history", classifier)
+    report = run_import(ledger, HISTORY + ["2025-02-01,Cold brew coffee,5,Food"],
+                        "history", classifier)
+    assert report.imported == 1 and report.duplicates == 4
+    assert classifier.index(1)["coffee"] == {"Food": 5}
+    assert CategoryClassifier(ledger.conn).index(1)["coffee"] == {"Food": 5}
+
+
+def test_without_a_classifier_only_past_products_are_used(ledger):
+    run_import(ledger, HISTORY, "history")
+    report = run_import(ledger, ["2025-02-01,flat white coffee,4", "2025-02-02,Iced coffee,5"],
+                        "new")
+    assert report.uncategorised == 1
+    assert categories(ledger)["flat white coffee"] == "Food"
+
+
+def test_failed_download_asks_for_the_file_again(bot):
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    async def get_file():
+        raise OSError("Connection reset by peer")
+
+    update = SimpleNamespace(message=SimpleNamespace(
+        reply_text=reply_text, document=SimpleNamespace(get_file=get_file, file_unique_id="x")))
+    assert asyncio.run(bot.import_document(update, SimpleNamespace())) == bot.WAITING_FOR_IMPORT
+    assert replies[-1].startswith("⚠️ Could not download")
@@ -0,0 +1,68 @@
+import asyncio
+
+from expenditure import Expenditure
+from importer import import_expenses
+
+
+def expense(product, amount, date, category="Food", user_id=1):
+    expenditure = Expenditure(product, amount, date, category, user_id)
+    expenditure.set_spend_type()
+    return expenditure
+
+
+def test_aggregates_match_recompute_after_add_and_add_many(ledger):
+    ledger.add(expense("Coffee", 3.5, "2025-03-01"))
+    ledger.add_many([expense("Lunch", 12, "2025-03-01"),
+                     expense("Shoes", 80, "2025-03-08", "Shopping"),
+                     expense("Salary", 2000, "2025-03-31", "Income"),
+                     expense("Refund", -5, "2025-04-02", "Shopping", user_id=2)])
+
+    assert ledger.verify_aggregates() == []
+    food = [r for r in ledger.totals(1, "2025-03") if r["category"] == "Food"]
+    assert sum(r["amount"] for r in food) == 15.5
+    assert sum(r["count"] for r in food) == 2
+
+
+def test_duplicate_ids_are_not_counted_twice(ledger):
+    first = expense("Coffee", 3.5, "2025-03-01")
+    first.id = "fixed"
+    again = expense("Coffee", 3.5, "2025-03-01")
+    again.id = "fixed"
+
+    assert ledger.add(first) is True
+    assert ledger.add_many([again]) == 0
+    assert ledger.verify_aggregates() == []
+    assert sum(r["count"] for r in ledger.totals(1, "2025-03")) == 1
+
+
+def test_aggregates_match_recompute_after_import(ledger):
+    lines = ["Date,Product,Price,Category",
+             "2025-03-01,Coffee,3.50,Food",
+             "02/03/2025,Taxi,$12.00,Transport",
+             "2025-04-10,Book,20,Education",
+             "2025-04-11,Coffee,4"]
+    report = asyncio.run(import_expenses(lines, ledger, 1, "test", chunk=2))
+
+    assert report.imported == 4
+    assert ledger.verify_aggregates() == []
+
+
+def test_deleted_rows_leave_the_aggregates(ledger):
+    ledger.add_many([expense("Coffee", 3.5, "2025-03-01"), expense("Tea", 2, "2025-03-02")])
+    with ledger.conn:
+        ledger.conn.execute("DELETE FROM expenses WHERE product = 'Tea'")
+
+    assert ledger.verify_aggregates() == []
+
+
+def test_verify_reports_drift_and_rebuild_repairs_it(ledger):
+    ledger.add_many([expense("Coffee", 3.5, "2025-03-01"), expense("Tea", 2, "2025-03-02")])
+    before = [tuple(r) for r in ledger.conn.execute("SELECT * FROM aggregates ORDER BY 1, 2, 3, 4, 5")]
+    with ledger.conn:
+        ledger.conn.execute("UPDATE aggregates SET amount = amount + 1")
+        ledger.conn.execute("DELETE FROM aggregates WHERE rowid = (SELECT MIN(rowid) FROM aggregates)")
+
+    assert ledger.verify_aggregates() != []
+    ledger.rebuild_aggregates()
+    assert ledger.verify_aggregates() == []
+    assert [tuple(r) for r in ledger.conn.execute("SELECT * FROM aggregates ORDER BY 1, 2, 3, 4, 5")] == before
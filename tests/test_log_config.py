@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+
+import log_config
+from log_config import REDACTED, RedactingFormatter, SamplingFilter, parse_levels
+
+BOT_TOKEN = "123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw8"
+
+
+def record(msg, *args, level=logging.INFO, name="bot"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_bot_tokens_are_redacted():
+    formatter = RedactingFormatter("%(message)s")
+    text = formatter.format(record("POST https://api.telegram.org/bot%s/sendMessage", BOT_TOKEN))
+    assert BOT_TOKEN not in text
+    assert text == f"POST https://api.telegram.org/bot{REDACTED}/sendMessage"
+
+
+def test_bare_tokens_are_redacted():
+    text = RedactingFormatter("%(message)s").format(record("token=%s.", BOT_TOKEN))
+    assert text == f"token={REDACTED}."
+
+
+def test_configured_secrets_are_redacted_including_tracebacks():
+    formatter = RedactingFormatter("%(message)s", secrets=["s3cret-webhook-value", "short", None])
+    try:
+        raise RuntimeError("bad secret s3cret-webhook-value")
+    except RuntimeError:
+        import sys
+        entry = record("webhook secret %s", "s3cret-webhook-value")
+        entry.exc_info = sys.exc_info()
+    text = formatter.format(entry)
+    assert "s3cret-webhook-value" not in text
+    assert text.startswith(f"webhook secret {REDACTED}\n")
+    assert text.endswith(f"RuntimeError: bad secret {REDACTED}")
+    # Values too short to be secrets are left alone rather than masking words.
+    assert formatter.secrets == ["s3cret-webhook-value"]
+
+
+def test_secret_environment_variables_are_redacted(monkeypatch, capsys):
+    monkeypatch.setenv("WEBHOOK_SECRET", "hunter2-hunter2-hunter2")
+    monkeypatch.setattr(log_config, "_listener", None)
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        log_config.configure_logging("INFO", "")
+        logging.getLogger("test").info("secret is %s", "hunter2-hunter2-hunter2")
+        log_config.stop_logging()
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+    out = capsys.readouterr().out
+    assert "test - INFO - secret is [REDACTED]" in out
+    assert "hunter2" not in out
+
+
+def test_sampling_keeps_bursts_then_one_in_every():
+    sampler = SamplingFilter(burst=3, window=60, every=5)
+    kept = [sampler.filter(record("saved %d rows", i)) for i in range(20)]
+    # Three in the burst, then the 5th, 10th and 15th message after it.
+    assert [i for i, k in enumerate(kept) if k] == [0, 1, 2, 7, 12, 17]
+    assert sampler.dropped == 14
+
+
+def test_sampling_is_per_template_and_never_drops_warnings():
+    sampler = SamplingFilter(burst=1, window=60, every=1000)
+    assert sampler.filter(record("a %s", 1))
+    assert not sampler.filter(record("a %s", 2))
+    assert sampler.filter(record("b %s", 1))
+    assert sampler.filter(record("a %s", 3, name="other"))
+    assert all(sampler.filter(record("a %s", i, level=logging.WARNING)) for i in range(5))
+
+
+def test_sampling_window_restarts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(log_config.time, "monotonic", lambda: now[0])
+    sampler = SamplingFilter(burst=1, window=10, every=1000)
+    assert sampler.filter(record("tick"))
+    assert not sampler.filter(record("tick"))
+    now[0] += 11
+    assert sampler.filter(record("tick"))
+
+
+@pytest.mark.parametrize("text, levels", [
+    ("", {}),
+    ("httpx=info, telegram.ext=DEBUG", {"httpx": "INFO", "telegram.ext": "DEBUG"}),
+    ("a=warning,,", {"a": "WARNING"}),
+])
+def test_parse_levels(text, levels):
+    assert parse_levels(text) == levels
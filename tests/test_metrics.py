@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.parametrize("url, label", [
+    ("https://api.telegram.org/bot123456:abc/sendMessage", "sendMessage"),
+    ("http://127.0.0.1:8081/bot123456:abc/getFile", "getFile"),
+    ("https://api.telegram.org/file/bot123456:abc/documents/file_3.csv", "file"),
+    ("https://api.telegram.org/file/bot123456:abc/photos/thumbnail", "file"),
+    ("http://127.0.0.1:8081/files/123456/voice/file_9.oga", "file"),
+])
+def test_bot_api_requests_are_labelled_by_method(bot, url, label):
+    assert bot.bot_api_label(url) == label
+
+
+def test_stats_report_credential_refreshes(bot):
+    stats = asyncio.run(bot.stats())
+    assert stats["google_credentials"] == {"refreshes": 0, "refresh_failures": 0}
+
+
+def test_stats_report_the_service_pool(bot):
+    assert asyncio.run(bot.stats())["sheets_services"] == bot.sheets_pool.stats()
+    assert set(bot.sheets_pool.stats()) == {"size", "builds"}
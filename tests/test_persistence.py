@@ -0,0 +1,67 @@
+import asyncio
+
+from expenditure import Expenditure
+from persistence import KVPersistence, SQLiteKV, dumps, loads
+
+
+def test_unchanged_entries_are_not_rewritten(ledger):
+    persistence = KVPersistence(SQLiteKV(ledger.conn))
+
+    async def main():
+        await persistence.update_conversation("oneoff", (1, 1), 1)
+        await persistence.update_conversation("oneoff", (1, 1), 1)
+        await persistence.update_user_data(1, {"expenses": []})
+        await persistence.update_user_data(1, {"expenses": []})
+
+    asyncio.run(main())
+    assert (persistence.writes, persistence.skipped_writes) == (2, 2)
+
+
+def test_remembered_values_are_capped(ledger):
+    persistence = KVPersistence(SQLiteKV(ledger.conn), cache_entries=2)
+
+    async def main():
+        for user_id in range(1, 6):
+            await persistence.update_user_data(user_id, {"n": user_id})
+        await persistence.update_user_data(5, {"n": 5})
+        await persistence.update_conversation("oneoff", (5, 5), 1)
+        await persistence.update_conversation("oneoff", (5, 5), None)
+        return await KVPersistence(SQLiteKV(ledger.conn)).get_user_data()
+
+    assert asyncio.run(main()) == {user_id: {"n": user_id} for user_id in range(1, 6)}
+    assert list(persistence._written) == [("user_data", "5")]
+    assert (persistence.writes, persistence.skipped_writes) == (6, 1)
+
+
+def test_pending_expenses_survive_a_restart(ledger):
+    expenditure = Expenditure("Coffee", 3.5, "2025-03-01", "Food", user_id=7)
+    expenditure.set_spend_type()
+    expenditure.id = "4f1c0d9e2b7a4c8e9d3f6a1b2c5e7d80"
+    pending = Expenditure("Taxi", 12, "2025-03-02", user_id=7)
+    pending.id = "a0b1c2d3e4f5a6b7c8d9e0f1a2b3c4d5"
+    user_data = {"expenses": [expenditure, pending], "selected_date": "2025-03-01"}
+
+    async def main():
+        await KVPersistence(SQLiteKV(ledger.conn)).update_user_data(7, user_data)
+        await KVPersistence(SQLiteKV(ledger.conn)).update_conversation("past", (7, 7), 1)
+        restarted = KVPersistence(SQLiteKV(ledger.conn))
+        return await restarted.get_user_data(), await restarted.get_conversations("past")
+
+    restored, conversations = asyncio.run(main())
+    assert conversations == {(7, 7): 1}
+    assert list(restored) == [7]
+    assert restored[7]["selected_date"] == "2025-03-01"
+    saved, waiting = restored[7]["expenses"]
+    for original, copy in ((expenditure, saved), (pending, waiting)):
+        assert isinstance(copy, Expenditure)
+        assert vars(copy) == vars(original)
+    assert saved.spend_type == "Essential" and waiting.category == ""
+
+
+def test_encoding_is_lossless():
+    expenditure = Expenditure("Refund", -5.25, "2025-03-03", "Shopping", user_id=9)
+    expenditure.set_spend_type()
+    expenditure.id = "id-1"
+    copy = loads(dumps({"expenses": [expenditure]}))["expenses"][0]
+    assert vars(copy) == vars(expenditure)
+    assert loads(dumps({"n": [1, "a"]}).encode()) == {"n": [1, "a"]}
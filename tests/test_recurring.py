@@ -0,0 +1,172 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import recurring
+from recurring import (RecurringExpenses, RecurringScheduler, first_occurrence,
+                       next_occurrence, parse_schedule)
+
+
+@pytest.fixture
+def rules(ledger):
+    return RecurringExpenses(ledger.conn)
+
+
+def run(scheduler, today):
+    return asyncio.run(scheduler.run_once(today=today))
+
+
+@pytest.mark.parametrize("words, schedule", [
+    (["monthly", "5"], (5, None)),
+    (["Monthly", "31"], (31, None)),
+    (["weekly"], (None, 7)),
+    (["daily"], (None, 1)),
+    (["every", "3", "days"], (None, 3)),
+    (["every", "2", "weeks"], (None, 14)),
+])
+def test_parse_schedule(words, schedule):
+    assert parse_schedule(words) == schedule
+
+
+@pytest.mark.parametrize("words", [["monthly", "0"], ["monthly", "32"], ["every", "0", "days"],
+                                   ["every", "2", "months"], ["yearly"], []])
+def test_parse_schedule_rejects(words):
+    with pytest.raises(ValueError):
+        parse_schedule(words)
+
+
+def test_month_end_is_clamped_without_drifting():
+    run = date(2025, 1, 31)
+    seen = []
+    for _ in range(4):
+        run = next_occurrence(run, 31, None)
+        seen.append(run)
+    assert seen == [date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31)]
+    assert next_occurrence(date(2024, 1, 30), 30, None) == date(2024, 2, 29)
+    assert next_occurrence(date(2025, 12, 5), 5, None) == date(2026, 1, 5)
+
+
+def test_first_occurrence_is_never_in_the_past():
+    today = date(2025, 2, 10)
+    assert first_occurrence(today, 10, None) == today
+    assert first_occurrence(today, 5, None) == date(2025, 3, 5)
+    assert first_occurrence(today, 31, None) == date(2025, 2, 28)
+    assert first_occurrence(today, None, 7) == today
+
+
+def test_missed_occurrences_are_caught_up_once(ledger, rules):
+    rule = rules.add(1, "Rent", 1000, "lifestyle", ["monthly", "31"], today="2025-01-01")
+    assert rule["category"] == "Lifestyle" and rule["next_run"] == "2025-01-31"
+    notified = []
+
+    async def on_saved(expenses):
+        notified.append(expenses)
+
+    scheduler = RecurringScheduler(rules, ledger, on_saved=on_saved)
+    assert run(scheduler, "2025-04-30") == 4
+    assert [e.date for e in notified[0]] == ["2025-01-31", "2025-02-28", "2025-03-31", "2025-04-30"]
+    assert rules.get(1, rule["id"])["next_run"] == "2025-05-31"
+    assert run(scheduler, "2025-04-30") == 0
+    assert len(notified) == 1
+    assert ledger.verify_aggregates() == []
+
+
+def test_interrupted_run_does_not_record_twice(ledger, rules):
+    rule = rules.add(1, "Gym", 20, "Lifestyle", ["weekly"], today="2025-03-01")
+    scheduler = RecurringScheduler(rules, ledger)
+    assert run(scheduler, "2025-03-15") == 3
+    # As if the rules had not been advanced after the expenses were saved.
+    with ledger.conn:
+        ledger.conn.execute("UPDATE recurring_rules SET next_run = '2025-03-01'")
+    assert run(scheduler, "2025-03-15") == 0
+    assert rules.get(1, rule["id"])["next_run"] == "2025-03-22"
+    assert ledger.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0] == 3
+
+
+def test_catch_up_is_capped_per_rule(ledger, rules, monkeypatch):
+    monkeypatch.setattr(recurring, "RECURRING_MAX_CATCH_UP", 5)
+    rule = rules.add(1, "Coffee", 3, "Food", ["daily"], today="2025-01-01")
+    assert run(RecurringScheduler(rules, ledger), "2025-01-31") == 5
+    assert rules.get(1, rule["id"])["next_run"] == "2025-02-01"
+
+
+def test_batches_are_reported_once_per_run(ledger, rules, monkeypatch):
+    for user_id in (1, 2, 3):
+        rules.add(user_id, "Netflix", 15.98, "Subscriptions", ["monthly", "1"], today="2025-01-01")
+    due = rules.due
+    monkeypatch.setattr(rules, "due", lambda today: due(today, limit=1))
+    calls = []
+
+    async def on_saved(expenses):
+        calls.append(len(expenses))
+
+    scheduler = RecurringScheduler(rules, ledger, on_saved=on_saved)
+    assert asyncio.run(scheduler.run_once("2025-03-01")) == 9
+    assert calls == [9]
+    assert scheduler.stats() == {"rules": 3, "runs": 1, "recorded": 9}
+
+
+def test_rules_are_per_user(rules):
+    rule = rules.add(1, "Rent", 1000, "Lifestyle", ["monthly", "1"], today="2025-01-01")
+    assert rules.remove(2, rule["id"]) is False
+    assert [r["id"] for r in rules.rules(1)] == [rule["id"]]
+    assert rules.remove(1, rule["id"]) is True
+    assert rules.rules(1) == []
+
+
+def test_long_catch_up_notification_is_summarised(bot, monkeypatch):
+    sent = []
+
+    async def send_message(chat_id, text, **kwargs):
+        sent.append(text)
+
+    monkeypatch.setattr(bot, "application", SimpleNamespace(bot=SimpleNamespace(send_message=send_message)))
+    rule = RecurringExpenses(bot.ledger.conn).add(900, "Coffee", 3, "Food", ["daily"],
+                                                   today="2024-01-01")
+    expenses, _ = RecurringExpenses(bot.ledger.conn).due("2024-12-31")
+    assert len(expenses) == 366
+
+    asyncio.run(bot.on_recurring_saved(expenses))
+    assert len(sent) == 1
+    assert len(sent[0]) < 4096
+    assert "366 recurring expense" in sent[0] and "356 more" in sent[0]
+    RecurringExpenses(bot.ledger.conn).remove(900, rule["id"])
+
+
+def test_budget_alerts_survive_a_failed_notification(bot, monkeypatch):
+    sent = []
+
+    async def send_message(chat_id, text, **kwargs):
+        if kwargs.get("parse_mode"):
+            raise RuntimeError("Bad Request: message is too long")
+        sent.append(text)
+
+    monkeypatch.setattr(bot, "application", SimpleNamespace(bot=SimpleNamespace(send_message=send_message)))
+    bot.budgets.set(901, "Subscriptions", 10)
+    rules = RecurringExpenses(bot.ledger.conn)
+    rules.add(901, "Netflix", 15.98, "Subscriptions", ["monthly", "1"], today="2025-01-01")
+    saved = []
+
+    async def on_saved(expenses):
+        saved.extend(expenses)
+        await bot.on_recurring_saved(expenses)
+
+    asyncio.run(RecurringScheduler(rules, bot.ledger, on_saved=on_saved).run_once("2025-01-01"))
+    assert len(saved) == 1
+    assert len(sent) == 1 and sent[0].startswith("🚨 Subscriptions")
+
+
+@pytest.mark.parametrize("args", [["foo"], ["Netflix", "monthly", "5"], ["15", "Food", "daily"]])
+def test_recurring_command_with_too_few_words_shows_usage(bot, args):
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=reply_text),
+                             effective_user=SimpleNamespace(id=902))
+    asyncio.run(bot.recurring_command(update, SimpleNamespace(args=args)))
+    assert replies and replies[0].startswith("Use /recurring")
+
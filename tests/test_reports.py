@@ -0,0 +1,110 @@
+import asyncio
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import reports
+from expenditure import Expenditure
+from reports import parse_period, period_insights
+from tenants import Tenant, default_tenant
+
+SGT = ZoneInfo("Asia/Singapore")
+
+
+def save(ledger, user_id, day, amount, recorded):
+    expenditure = Expenditure("lunch", amount, day, "Food", user_id)
+    expenditure.set_spend_type()
+    ledger.add_many([expenditure])
+    with ledger.conn:
+        ledger.conn.execute("UPDATE expenses SET created_at = ? WHERE id = ?",
+                            (datetime.fromisoformat(recorded).replace(tzinfo=SGT).timestamp(),
+                             expenditure.id))
+
+
+@pytest.fixture
+def sheet_reads(monkeypatch):
+    reads = []
+
+    async def get_month_totals(tenant, months):
+        reads.append(months)
+        raise AssertionError("the sheet is not read for this period")
+
+    monkeypatch.setattr(reports, "get_month_totals", get_month_totals)
+    return reads
+
+
+def test_covered_period_comes_from_the_ledger(ledger, sheet_reads):
+    save(ledger, 1, "2024-12-20", 5, "2024-12-20")
+    save(ledger, 1, "2025-01-05", 10, "2025-01-05")
+    save(ledger, 1, "2025-02-05", 20, "2025-02-05")
+    months = [date(2025, 1, 1), date(2025, 2, 1)]
+    insights = asyncio.run(period_insights(ledger, Tenant("own"), 1, months, today="2025-02-28"))
+    assert [m[1:] for m in insights["months"]] == [("$10.00", ""), ("$20.00", "+100.0%")]
+    assert "note" not in insights and not sheet_reads
+
+
+def test_shared_spreadsheet_is_never_a_fallback(ledger, sheet_reads):
+    save(ledger, 1, "2025-02-05", 20, "2025-02-05")
+    save(ledger, 2, "2025-01-05", 99, "2025-01-05")
+    months = [date(2025, 1, 1), date(2025, 2, 1)]
+    insights = asyncio.run(period_insights(ledger, default_tenant(), 1, months, today="2025-02-28"))
+    assert insights["total"] == "$20.00"
+    assert insights["note"] == "Only includes expenses recorded since 2025-02-05."
+    assert not sheet_reads
+
+
+def test_own_spreadsheet_serves_the_whole_period(ledger, monkeypatch):
+    save(ledger, 1, "2025-02-05", 20, "2025-02-05")
+    months = [date(2025, 1, 1), date(2025, 2, 1)]
+    reads = []
+
+    async def get_month_totals(tenant, wanted):
+        reads.append(wanted)
+        return {month: reports.Totals() for month in wanted}
+
+    monkeypatch.setattr(reports, "get_month_totals", get_month_totals)
+    insights = asyncio.run(period_insights(ledger, Tenant("own"), 1, months, today="2025-02-28"))
+    assert reads == [months]
+    assert insights["total"] == "$0.00"
+
+
+TODAY = "2025-03-14"
+
+
+def test_empty_period_is_this_month():
+    assert parse_period("", TODAY) == ([date(2025, 3, 1)], "This Month’s Insights")
+    assert parse_period("  ", TODAY)[0] == [date(2025, 3, 1)]
+
+
+def test_year_to_date():
+    months, title = parse_period("YTD", TODAY)
+    assert months == [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1)]
+    assert title == "2025 Year to Date"
+
+
+@pytest.mark.parametrize("text, first", [("last 1", date(2025, 3, 1)),
+                                         ("last  3", date(2025, 1, 1)),
+                                         ("last 12", date(2024, 4, 1))])
+def test_last_months(text, first):
+    months, _ = parse_period(text, TODAY)
+    assert months[0] == first and months[-1] == date(2025, 3, 1)
+    assert len(months) == int(text.split()[-1])
+
+
+def test_single_month():
+    assert parse_period("2024-12", TODAY) == ([date(2024, 12, 1)], "December 2024")
+    assert parse_period("2025-3", TODAY)[0] == [date(2025, 3, 1)]
+
+
+@pytest.mark.parametrize("text, error", [
+    ("last 0", "choose between 1 and 12"),
+    ("last 13", "choose between 1 and 12"),
+    ("2025-04", "has not started"),
+    ("2025-13", "unknown period"),
+    ("2025-00", "unknown period"),
+    ("last week", "unknown period"),
+])
+def test_rejected_periods(text, error):
+    with pytest.raises(ValueError, match=error):
+        parse_period(text, TODAY)
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from google.auth.credentials import AnonymousCredentials
+
+import sheets_client
+from ratelimit import TokenBucket
+from sheets_client import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_WRITE, Scheduler
+
+
+def test_worker_slots_go_to_the_most_urgent_request(monkeypatch):
+    monkeypatch.setattr(sheets_client, "MAX_WORKERS", 1)
+    scheduler = Scheduler()
+    order = []
+
+    async def request(name, priority):
+        await scheduler.claim(priority)
+        order.append(name)
+        await asyncio.sleep(0)
+        scheduler.release()
+
+    async def main():
+        await scheduler.claim(PRIORITY_BACKGROUND)
+        tasks = [asyncio.create_task(request(f"background {i}", PRIORITY_BACKGROUND))
+                 for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued_for_workers"] == 4
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive", "background 0", "background 1", "background 2"]
+    assert scheduler.stats()["busy_workers"] == 0
+
+
+def test_cancelled_waiter_passes_its_slot_on(monkeypatch):
+    monkeypatch.setattr(sheets_client, "MAX_WORKERS", 1)
+    scheduler = Scheduler()
+
+    async def main():
+        await scheduler.claim(PRIORITY_BACKGROUND)
+        first = asyncio.create_task(scheduler.claim(PRIORITY_INTERACTIVE))
+        second = asyncio.create_task(scheduler.claim(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        scheduler.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, 1)
+        scheduler.release()
+
+    asyncio.run(main())
+    assert scheduler.stats()["busy_workers"] == 0
+
+
+def test_quota_waits_are_counted():
+    scheduler = Scheduler()
+    scheduler.buckets["read"].tokens = 0
+    scheduler.buckets["read"].rate = 1000
+
+    async def main():
+        await asyncio.gather(*(scheduler.acquire("read", PRIORITY_BACKGROUND) for _ in range(3)))
+
+    asyncio.run(main())
+    stats = scheduler.stats()
+    assert stats["read_waits"] == stats["throttled"] == 3
+    assert stats["write_waits"] == 0
+
+
+
+def test_spreadsheet_limit_serves_interactive_requests_first():
+    scheduler = Scheduler()
+    limiter = TokenBucket(rate=50, capacity=1)
+    limiter.tokens = 0
+    order = []
+
+    async def request(name, priority):
+        await scheduler.acquire("read", priority, limiter)
+        order.append(name)
+
+    async def main():
+        tasks = [asyncio.create_task(request(f"sync {i}", PRIORITY_WRITE)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("insights", PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued_for_limiters"] == 4
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order[0] == "insights"
+    stats = scheduler.stats()
+    assert stats["limiter_waits"] == stats["throttled"] == 4
+    assert stats["read_waits"] == 0
+
+
+class BlockingRequest:
+    """Stands in for a googleapiclient write request, returning when released."""
+
+    method = "POST"
+    methodId = "sheets.spreadsheets.values.append"
+
+    def __init__(self):
+        self.done = threading.Event()
+
+    def execute(self, http):
+        self.done.wait(5)
+        return {"ok": True}
+
+
+def test_timed_out_request_keeps_its_slot_until_the_thread_returns(monkeypatch):
+    monkeypatch.setattr(sheets_client, "MAX_WORKERS", 1)
+    monkeypatch.setattr(sheets_client, "scheduler", Scheduler())
+    credentials = AnonymousCredentials()
+    stuck, queued = BlockingRequest(), BlockingRequest()
+    queued.done.set()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await sheets_client.execute(stuck, credentials, timeout=0.05)
+        assert sheets_client.scheduler.stats()["busy_workers"] == 1
+        task = asyncio.create_task(sheets_client.execute(queued, credentials, timeout=1))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        stuck.done.set()
+        assert await task == {"ok": True}
+
+    asyncio.run(main())
+    assert sheets_client.scheduler.stats()["busy_workers"] == 0
+
+
+class ThrottledRequest:
+    method = "POST"
+    methodId = "sheets.spreadsheets.values.append"
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def execute(self, http):
+        if self.failures:
+            self.failures -= 1
+            raise HttpError(httplib2.Response({"status": 429, "retry-after": "0"}), b"")
+        return {"ok": True}
+
+
+def test_retries_are_charged_to_the_limiter(monkeypatch):
+    monkeypatch.setattr(sheets_client, "scheduler", Scheduler())
+    limiter = TokenBucket(rate=1, capacity=10)
+
+    async def main():
+        return await sheets_client.execute(ThrottledRequest(2), AnonymousCredentials(),
+                                           limiter=limiter)
+
+    assert asyncio.run(main()) == {"ok": True}
+    assert limiter.tokens < 8
+    assert sheets_client.scheduler.stats()["retried"] == 2
+
+
+def test_settled_waits_for_a_timed_out_request(monkeypatch):
+    monkeypatch.setattr(sheets_client, "scheduler", Scheduler())
+    request = BlockingRequest()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await sheets_client.execute(request, AnonymousCredentials(), timeout=0.05,
+                                        key="tab")
+        waiter = asyncio.create_task(sheets_client.settled("tab"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        request.done.set()
+        await asyncio.wait_for(waiter, 1)
+        await sheets_client.settled("tab")
+
+    asyncio.run(main())
+    assert "tab" not in sheets_client._running
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from expenditure import Expenditure
+from syncer import LedgerSyncer
+
+
+class Sheet:
+    """sync_rows stand-in keeping appended rows by ID, as the month tabs would."""
+
+    def __init__(self, fail_after_append=None):
+        self.rows = []
+        self.verified = []
+        self.fail_after_append = fail_after_append
+
+    async def sync_rows(self, tenant, month_tab, rows, verify=False):
+        self.verified.append(verify)
+        if verify:
+            existing = {row[-1] for row in self.rows}
+            rows = [row for row in rows if row[-1] not in existing]
+        self.rows.extend(rows)
+        if self.fail_after_append:
+            error, self.fail_after_append = self.fail_after_append, None
+            raise error
+        return len(rows)
+
+
+def add_expenses(ledger, n=3):
+    expenses = []
+    for i in range(n):
+        expenditure = Expenditure(f"item {i}", 1.5, "2025-03-0%d" % (i + 1), "Food", 1)
+        expenditure.set_spend_type()
+        expenses.append(expenditure)
+    ledger.add_many(expenses)
+
+
+def test_first_attempt_does_not_verify(ledger):
+    add_expenses(ledger)
+    sheet = Sheet()
+    assert asyncio.run(LedgerSyncer(ledger, sheet.sync_rows, lambda user: "tenant").sync_once()) == 3
+    assert sheet.verified == [False]
+    assert ledger.sync_lag()["unsynced"] == 0
+
+
+def test_failed_append_that_landed_is_not_repeated(ledger):
+    add_expenses(ledger)
+    sheet = Sheet(fail_after_append=TimeoutError())
+    syncer = LedgerSyncer(ledger, sheet.sync_rows, lambda user: "tenant")
+    assert asyncio.run(syncer.sync_once()) == 0
+    with ledger.conn:
+        ledger.conn.execute("UPDATE expenses SET next_attempt_at = 0")
+    assert asyncio.run(syncer.sync_once()) == 3
+    assert sheet.verified == [False, True]
+    assert len(sheet.rows) == 3
+
+
+def test_append_cut_short_by_a_restart_is_verified(ledger):
+    add_expenses(ledger)
+    # The append lands, then the process dies before the rows are marked.
+    sheet = Sheet(fail_after_append=KeyboardInterrupt())
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(LedgerSyncer(ledger, sheet.sync_rows, lambda user: "tenant").sync_once())
+    assert asyncio.run(LedgerSyncer(ledger, sheet.sync_rows, lambda user: "tenant").sync_once()) == 3
+    assert sheet.verified == [False, True]
+    assert len(sheet.rows) == 3
@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import telegramcalendar
+from telegramcalendar import (CALLBACK_PATTERN, DATA_IGNORE, create_calendar,
+                              create_callback_data, process_calendar_selection,
+                              separate_callback_data)
+
+
+@pytest.mark.parametrize("data, fields", [
+    ("cal;d;2025;4;10", ("d", 2025, 4, 10)),
+    ("cal;p;2025;1", ("p", 2025, 1, None)),
+    ("cal;i", ("i", None, None, None)),
+    # Keyboards sent before the compact encoding.
+    ("CALENDAR;DAY;2025;4;10", ("d", 2025, 4, 10)),
+    ("CALENDAR;NEXT-MONTH;2024;12;0", ("n", 2024, 12, 0)),
+    ("CALENDAR;IGNORE;2025;4;0", ("i", 2025, 4, 0)),
+])
+def test_separate_callback_data(data, fields):
+    assert CALLBACK_PATTERN.match(data)
+    assert separate_callback_data(data) == fields
+
+
+def test_callback_data_round_trips_within_telegram_limit():
+    data = create_callback_data("d", 2025, 12, 31)
+    assert separate_callback_data(data) == ("d", 2025, 12, 31)
+    assert len(data.encode()) <= 64
+
+
+def test_foreign_callback_data_is_rejected():
+    assert not CALLBACK_PATTERN.match("Food")
+    with pytest.raises(ValueError):
+        separate_callback_data("other;d;2025;4;10")
+
+
+class Query:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+        self.markups = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+    async def edit_message_reply_markup(self, reply_markup):
+        self.markups.append(reply_markup)
+
+
+def tap(data):
+    query = Query(data)
+    result = asyncio.run(process_calendar_selection(SimpleNamespace(callback_query=query), None))
+    return result, query
+
+
+def shown_month(markup) -> str:
+    return markup.inline_keyboard[0][0].text
+
+
+@pytest.mark.parametrize("data, month", [
+    ("cal;p;2025;1", "December 2024"),
+    ("cal;n;2024;12", "January 2025"),
+    ("cal;p;2025;3", "February 2025"),
+    ("CALENDAR;PREV-MONTH;2025;1;0", "December 2024"),
+])
+def test_arrows_wrap_across_years(data, month):
+    result, query = tap(data)
+    assert result == (False, None)
+    assert query.answers == [None]
+    assert [shown_month(m) for m in query.markups] == [month]
+
+
+def test_ignored_taps_do_not_edit_the_keyboard():
+    result, query = tap(DATA_IGNORE)
+    assert result == (False, None)
+    assert query.answers == [None] and query.markups == []
+
+
+def test_day_tap_selects_the_date():
+    result, query = tap(create_callback_data("d", 2024, 2, 29))
+    assert result == (True, datetime.date(2024, 2, 29))
+    assert query.markups == []
+
+
+def test_current_month_markup_is_cached():
+    assert create_calendar(2025, 4) is create_calendar(2025, 4)
+    assert shown_month(create_calendar(2025, 4)) == "April 2025"
+    assert telegramcalendar._build_calendar.cache_info().hits >= 1
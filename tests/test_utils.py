@@ -0,0 +1,41 @@
+import pytest
+
+from utils import find_category, find_date, parse_amount, parse_date
+
+
+@pytest.mark.parametrize("text, amount", [
+    ("3.50", 3.5), ("$1,234.00", 1234.0), ("-12", -12.0), ("-$5", -5.0), ("$-5", -5.0),
+    ("+ 4", 4.0), ("€.5", 0.5), (7, 7.0), (2.25, 2.25),
+])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
+
+
+@pytest.mark.parametrize("text", ["", "abc", "--5", "1.2.3", "$"])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError, match="invalid amount"):
+        parse_amount(text)
+
+
+@pytest.mark.parametrize("text, day", [
+    ("2025-03-05", "2025-03-05"), ("2025-3-5", "2025-03-05"), ("05/03/2025", "2025-03-05"),
+    ("5/3/25", "2025-03-05"), (" 31/12/2024 ", "2024-12-31"),
+])
+def test_parse_date(text, day):
+    assert parse_date(text) == day
+
+
+def test_day_and_month_mean_this_year():
+    assert parse_date("5/3") == f"{find_date()[:4]}-03-05"
+
+
+@pytest.mark.parametrize("text", ["2025-13-01", "31/02/2025", "yesterday", "5/3/2025/1"])
+def test_parse_date_rejects(text):
+    with pytest.raises(ValueError, match="invalid date"):
+        parse_date(text)
+
+
+def test_find_category():
+    assert find_category(" food ") == "Food"
+    assert find_category("SUBSCRIPTIONS") == "Subscriptions"
+    assert find_category("groceries") is None
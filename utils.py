@@ -1,6 +1,6 @@
-import logging
 from dotenv import load_dotenv
 import os
+import re
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
@@ -30,7 +30,6 @@ def find_month(date_str: str | None = None) -> str:
     If no date provided, uses today.
     """
     date_str = date_str or find_date()
-    logging.info(f"DATEE {date_str}")
     mm = date_str[5:7]
     return DATES[mm]
 
@@ -50,17 +49,11 @@ def chunk_list(lst, n):
     """Chunk a list into sublists of size n."""
     return [lst[i:i + n] for i in range(0, len(lst), n)]
 
-# format date from CALENDAR;DAY;2025;4;10 to 10/04/25
+# format a date picked on the calendar as 10/04/25
 
 
-def format_calendar_date(raw_date):
-    try:
-        _, _, year, month, day = raw_date.split(';')
-        formatted_date = f"{int(day):02d}/{int(month):02d}/{str(year)[-2:]}"
-        return formatted_date
-    except Exception as e:
-        print(f"Error formatting date: {e}")
-        return raw_date
+def format_calendar_date(date) -> str:
+    return date.strftime("%d/%m/%y")
 
 
 # format insights msg
@@ -74,7 +67,8 @@ def format_insights_message(insights: dict) -> str:
 
     lines = []
 
-    lines.append("📈 *This Month’s Insights*\n")
+    title = insights.get("title", "This Month’s Insights")
+    lines.append(f"📈 *{escape_markdown_v2(title)}*\n")
 
     lines.append("*Averages*")
     lines.append(f"• Weekday: {escape_markdown_v2(safe(avg['weekday']))}")
@@ -100,6 +94,15 @@ def format_insights_message(insights: dict) -> str:
     lines.append(f"\n\n*Total Spending*")
     lines.append(f"{escape_markdown_v2(safe(insights['total']))}")
 
+    if insights.get("months"):
+        lines.append("\n*Month over Month*")
+        for month, total, change in insights["months"]:
+            suffix = f" ({change})" if change else ""
+            lines.append(f"• {escape_markdown_v2(month)}: {escape_markdown_v2(total + suffix)}")
+
+    if insights.get("note"):
+        lines.append(f"\n_{escape_markdown_v2(insights['note'])}_")
+
     return "\n".join(lines)
 
 
@@ -121,7 +124,7 @@ DATES = {
 # STANDARD KEYBOARDS
 CATEGORIES = ["Income", "Food", "Transport", "Education",
               "Shopping", "Gifts", "Lifestyle", "Travel", "Subscriptions"]
-HEADERS = ["Date", "Product", "Price", "Category", "Spend Type"]
+HEADERS = ["Date", "Product", "Price", "Category", "Spend Type", "ID"]
 CATEGORY_TO_SPEND_TYPE_DEFAULT = {
     "Income": "Income",  # special case
     "Food": "Essential",
@@ -133,3 +136,49 @@ CATEGORY_TO_SPEND_TYPE_DEFAULT = {
     "Travel": "One-off",
     "Subscriptions": "Recurring",
 }
+
+# INPUT PARSING, shared by typed expenses, commands and imports
+CURRENCY_SYMBOLS = "$€£¥"
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y")
+_AMOUNT_RE = re.compile(r"([-+]?)(\d+(?:\.\d*)?|\.\d+)")
+_CATEGORY_NAMES = {c.lower(): c for c in CATEGORIES}
+
+
+def parse_amount(text) -> float:
+    """
+    Parse an amount such as '3.50', '$1,234.00', '-$5' or '$-5'.
+
+    Raises:
+        ValueError: If `text` is not an amount.
+    """
+    if isinstance(text, (int, float)):
+        return float(text)
+    # A sign may come before or after the currency symbol.
+    match = _AMOUNT_RE.fullmatch(re.sub(rf"[\s,{CURRENCY_SYMBOLS}]", "", str(text)))
+    if match is None:
+        raise ValueError(f"invalid amount {text!r}")
+    return -float(match[2]) if match[1] == "-" else float(match[2])
+
+
+def parse_date(text: str) -> str:
+    """
+    Normalise a yyyy-mm-dd, dd/mm/yyyy or dd/mm/yy date to yyyy-mm-dd;
+    dd/mm means this year.
+
+    Raises:
+        ValueError: If `text` is not a date.
+    """
+    text = text.strip()
+    if text.count("/") == 1:
+        text = f"{text}/{find_date()[:4]}"
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date {text!r}")
+
+
+def find_category(text: str) -> str | None:
+    """The category named by `text` in any case, or None."""
+    return _CATEGORY_NAMES.get(text.strip().lower())
@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = int(os.getenv("SHEETS_BATCH_SIZE", "50"))
+MAX_DELAY = float(os.getenv("SHEETS_BATCH_WINDOW", "0.25"))
+
+
+class WriteBatcher:
+    """
+    Write-behind buffer that coalesces rows per key (month tab) into one flush.
+
+    A key is flushed as soon as it holds `max_batch` rows or `max_delay`
+    seconds after its first buffered row, whichever comes first. Callers of
+    `submit` are only released once the flush carrying their row has
+    completed, and receive the flush result (or its exception).
+    """
+
+    def __init__(self, flush, max_batch: int = MAX_BATCH, max_delay: float = MAX_DELAY):
+        """
+        Args:
+            flush: Coroutine function `flush(key, rows)` writing rows in one request.
+            max_batch (int): Flush a key once this many rows are buffered.
+            max_delay (float): Longest time, in seconds, a row may wait to be flushed.
+        """
+        self._flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = {}
+        self._timers = {}
+        self._locks = {}
+        self._inflight = set()
+        self._closed = False
+
+        self.batches = 0
+        self.rows = 0
+        self.failed_batches = 0
+        self.max_batch_seen = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    async def submit(self, key, row):
+        """Buffer `row` under `key` and wait until it has been flushed."""
+        if self._closed:
+            raise RuntimeError("WriteBatcher is closed")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((row, future))
+
+        if len(batch) >= self.max_batch:
+            self._start_flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(
+                self.max_delay, self._start_flush, key)
+
+        return await future
+
+    async def submit_many(self, key, rows):
+        """
+        Flush `rows` under `key` as one batch of their own and wait for it.
+
+        For callers that already batched their rows: anything buffered for
+        the key is flushed first, then `rows` in a single flush regardless of
+        `max_batch`.
+        """
+        if self._closed:
+            raise RuntimeError("WriteBatcher is closed")
+
+        self._start_flush(key)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task = loop.create_task(self._run_flush(key, [(row, future) for row in rows]))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return await future
+
+    def _start_flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_flush(key, batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run_flush(self, key, batch):
+        # Flushes of the same key run one after another so rows keep their order.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            started = time.monotonic()
+            try:
+                result = await self._flush(key, [row for row, _ in batch])
+            except Exception as e:
+                self.failed_batches += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                elapsed = time.monotonic() - started
+                self.batches += 1
+                self.rows += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                self.flush_seconds_total += elapsed
+                self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+                logger.debug("Flushed %d row(s) to %s in %.3fs",
+                             len(batch), key, elapsed)
+
+    async def close(self):
+        """Stop accepting rows, flush everything buffered and wait for it."""
+        self._closed = True
+        for key in list(self._pending):
+            self._start_flush(key)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Return batch-size and flush-latency counters."""
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_batches": self.failed_batches,
+            "pending_rows": sum(len(b) for b in self._pending.values()),
+            "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_flush_seconds": self.flush_seconds_total / self.batches if self.batches else 0.0,
+            "max_flush_seconds": self.flush_seconds_max,
+        }